@@ -0,0 +1,264 @@
+"""
+Measure where the build time goes: every connected event handler and every
+directive's run() is wrapped to record its wall and CPU time, per document.
+
+This is disabled by default, and then nothing is wrapped. Enable it with:
+
+    make html O="-D build_profiler_output=_build/profile"
+
+which writes in _build/profile:
+ - report.txt, the time spent by extension, by handler and by document,
+ - profile.json, the raw measures,
+ - profile.folded (if build_profiler_folded is True), a folded-stack file
+   that can be given to flamegraph.pl or speedscope.
+
+Documents read by parallel workers (-j N) are accounted for, but not the
+ones written by parallel workers.
+"""
+
+from collections import defaultdict
+from functools import wraps
+from os.path import join
+from typing import Dict, List, Tuple
+import json
+import os
+import time
+
+from docutils.parsers.rst import directives as docutils_directives
+from sphinx.application import Sphinx
+from sphinx.util import logging
+from sphinx.util.osutil import ensuredir
+
+logger = logging.getLogger(__name__)
+
+# Measures are [wall time, cpu time, calls]
+Measure = List[float]
+
+#############################################################
+
+def callable_name(f) -> str:
+    f = getattr(f, '__func__', f)
+    return f"{getattr(f, '__module__', '?')}.{getattr(f, '__qualname__', repr(f))}"
+
+class BuildProfiler:
+    def __init__(self, app: Sphinx) -> None:
+        self.app = app
+        self.pid = os.getpid()
+        self.stack: List[str] = []
+
+        # Inclusive measures, indexed by stack of frames
+        self.stacks: Dict[Tuple[str,...],Measure] = {}
+
+        # Inclusive measures of the outermost frames, by document then handler
+        self.documents: Dict[str,Dict[str,Measure]] = {}
+
+        self.build_start = time.perf_counter()
+
+    def current_docname(self) -> str | None:
+        docname = self.app.env.temp_data.get('docname') if self.app.env is not None else None
+        if docname is None and self.app.builder is not None:
+            docname = getattr(self.app.builder, 'current_docname', None)
+        return docname
+
+    def call(self, frames: List[str], f, *args, **kwargs):
+        if os.getpid() != self.pid:
+            self.start_worker()
+
+        self.stack.extend(frames)
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            return f(*args, **kwargs)
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+            add(self.stacks.setdefault(tuple(self.stack), [0.0, 0.0, 0]), wall, cpu)
+            del self.stack[-len(frames):]
+            docname = self.current_docname()
+            if docname is not None and not self.stack:
+                per_doc = self.documents.setdefault(docname, {})
+                add(per_doc.setdefault(frames[-1], [0.0, 0.0, 0]), wall, cpu)
+
+    def start_worker(self) -> None:
+        """
+        We are in a process forked for parallel reading: only keep what this
+        process measures, and hand it over to the main process in the env.
+        """
+        self.pid = os.getpid()
+        self.stacks = {}
+        self.documents = {}
+        self.app.env.build_profiler_worker_data = (self.stacks, self.documents)
+
+    def merge(self, stacks, documents) -> None:
+        for stack, measure in stacks.items():
+            add(self.stacks.setdefault(stack, [0.0, 0.0, 0]), *measure)
+        for docname, handlers in documents.items():
+            per_doc = self.documents.setdefault(docname, {})
+            for label, measure in handlers.items():
+                add(per_doc.setdefault(label, [0.0, 0.0, 0]), *measure)
+
+    # Wrapping
+
+    def wrap_event_listeners(self) -> None:
+        for event, listeners in self.app.events.listeners.items():
+            for i, listener in enumerate(listeners):
+                if getattr(listener.handler, '_build_profiler', False):
+                    continue
+                listeners[i] = listener._replace(
+                    handler=self.wrap_handler(event, listener.handler)
+                )
+
+    def wrap_handler(self, event: str, handler):
+        frames = [f"event:{event}", callable_name(handler)]
+        @wraps(handler)
+        def wrapper(*args, **kwargs):
+            return self.call(frames, handler, *args, **kwargs)
+        wrapper._build_profiler = True
+        return wrapper
+
+    def wrap_directives(self) -> None:
+        for name, directive in docutils_directives._directives.items():
+            run = directive.__dict__.get('run')
+            if run is None or getattr(run, '_build_profiler', False):
+                continue
+            directive.run = self.wrap_run(run)
+
+    def wrap_run(self, run):
+        profiler = self
+        label = callable_name(run)
+        @wraps(run)
+        def wrapper(self, *args, **kwargs):
+            frames = [f"directive:{self.name}", label]
+            return profiler.call(frames, run, self, *args, **kwargs)
+        wrapper._build_profiler = True
+        return wrapper
+
+    # Report
+
+    def self_times(self) -> Dict[Tuple[str,...],Measure]:
+        """Measures of each stack, excluding the time spent in nested frames"""
+        self_measures = {stack: list(measure) for stack, measure in self.stacks.items()}
+        for stack, (wall, cpu, _) in self.stacks.items():
+            # The parent of a handler stack is the stack without its last 2
+            # frames (event or directive name, and handler).
+            parent = self_measures.get(stack[:-2])
+            if parent is not None and len(stack) > 2:
+                parent[0] -= wall
+                parent[1] -= cpu
+        return self_measures
+
+    def write(self, outdir: str, folded: bool) -> None:
+        ensuredir(outdir)
+        total_time = time.perf_counter() - self.build_start
+        self_measures = self.self_times()
+
+        by_handler = defaultdict(lambda: [0.0, 0.0, 0])
+        by_extension = defaultdict(lambda: [0.0, 0.0, 0])
+        for stack, measure in self_measures.items():
+            handler = stack[-1]
+            add(by_handler[(stack[-2], handler)], *measure)
+            add(by_extension[handler.split('.')[0]], measure[0], measure[1], 0)
+
+        document_totals = {
+            docname: sum(m[0] for m in handlers.values())
+            for docname, handlers in self.documents.items()
+        }
+
+        lines = [f"Total build time: {total_time:.2f}s", ""]
+        lines += ["Self time by extension (top-level module)", ""]
+        lines += [f"{'wall (s)':>10} {'cpu (s)':>10}  extension"]
+        measured = 0.0
+        for extension, (wall, cpu, _) in sorted(by_extension.items(), key=lambda kv: -kv[1][0]):
+            measured += wall
+            lines.append(f"{wall:10.3f} {cpu:10.3f}  {extension}")
+        if measured < total_time:
+            # Otherwise, parallel workers were measured and their times add up
+            lines.append(f"{total_time - measured:10.3f} {'':>10}  (outside of any handler or directive)")
+
+        lines += ["", "Self time by handler", ""]
+        lines += [f"{'wall (s)':>10} {'cpu (s)':>10} {'calls':>8}  handler"]
+        for (frame, handler), (wall, cpu, calls) in sorted(by_handler.items(), key=lambda kv: -kv[1][0]):
+            lines.append(f"{wall:10.3f} {cpu:10.3f} {calls:8d}  {frame} {handler}")
+
+        lines += ["", "Slowest documents (time in handlers and directives)", ""]
+        for docname, wall in sorted(document_totals.items(), key=lambda kv: -kv[1])[:30]:
+            lines.append(f"{wall:10.3f}  {docname}")
+            top = sorted(self.documents[docname].items(), key=lambda kv: -kv[1][0])[:3]
+            for label, (wall, _, calls) in top:
+                lines.append(f"{'':10}    {wall:8.3f}  {label} ({calls} calls)")
+
+        with open(join(outdir, "report.txt"), "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+        with open(join(outdir, "profile.json"), "w", encoding="utf-8") as f:
+            json.dump({
+                "total_time": total_time,
+                "stacks": [
+                    {"stack": list(stack), "wall": m[0], "cpu": m[1], "calls": m[2]}
+                    for stack, m in self.stacks.items()
+                ],
+                "documents": self.documents,
+            }, f, indent=1)
+
+        if folded:
+            with open(join(outdir, "profile.folded"), "w", encoding="utf-8") as f:
+                for stack, (wall, _, _) in self_measures.items():
+                    micros = int(wall * 1e6)
+                    if micros > 0:
+                        frames = [frame.replace(';', ',') for frame in stack]
+                        f.write(f"{';'.join(frames)} {micros}\n")
+
+def add(measure: Measure, wall: float, cpu: float, calls: int = 1) -> None:
+    measure[0] += wall
+    measure[1] += cpu
+    measure[2] += calls
+
+#############################################################
+
+def on_config_inited(app: Sphinx, config) -> None:
+    if not config.build_profiler_output:
+        return
+    profiler = app.build_profiler = BuildProfiler(app)
+    app.connect('env-merge-info', on_env_merge_info)
+    app.connect('build-finished', on_build_finished)
+    profiler.wrap_directives()
+    profiler.wrap_event_listeners()
+
+def on_builder_inited(app: Sphinx) -> None:
+    profiler = getattr(app, 'build_profiler', None)
+    if profiler is not None:
+        # Directives and handlers may have been added since config-inited
+        profiler.wrap_directives()
+        profiler.wrap_event_listeners()
+
+def on_env_merge_info(app: Sphinx, env, docnames, other) -> None:
+    data = getattr(other, 'build_profiler_worker_data', None)
+    if data is not None:
+        app.build_profiler.merge(*data)
+        del other.build_profiler_worker_data
+
+def on_build_finished(app: Sphinx, exception) -> None:
+    outdir = join(app.srcdir, app.config.build_profiler_output)
+    app.build_profiler.write(outdir, app.config.build_profiler_folded)
+    logger.info(f"Build profile written to {outdir}")
+
+#############################################################
+# Setup
+
+def setup(app: Sphinx):
+    # Directory where the profile is written, relative to the source
+    # directory. The profiler is disabled when empty.
+    app.add_config_value("build_profiler_output", "", '', [str])
+
+    # Also write a folded-stack file for flamegraph tools
+    app.add_config_value("build_profiler_folded", False, '', [bool])
+
+    # Late, so that handlers of other extensions are connected before
+    app.connect('config-inited', on_config_inited, priority=900)
+    app.connect('builder-inited', on_builder_inited, priority=900)
+
+    return {
+        'version': '0.1',
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
+    }
@@ -42,18 +42,25 @@ content must be saved, relative to the root tangle directory.
 
 """
 
-from sphinx.application import Sphinx
+from __future__ import annotations
+from typing import TYPE_CHECKING
 
-from .builder import TangleBuilder
-from .directives import setup as setup_directives
-from .config import setup as setup_config
-from .nodes import setup as setup_nodes
-from .handlers import setup as setup_handlers
+if TYPE_CHECKING:
+    from sphinx.application import Sphinx
 
 #############################################################
 # Setup
 
 def setup(app: Sphinx):
+    # Imported here rather than at the top of the module, so that the
+    # command line tools of this package (e.g. query.py) can load the
+    # registry without loading Sphinx.
+    from .builder import TangleBuilder
+    from .directives import setup as setup_directives
+    from .config import setup as setup_config
+    from .nodes import setup as setup_nodes
+    from .handlers import setup as setup_handlers
+
     setup_config(app)
 
     setup_nodes(app)
@@ -68,6 +75,7 @@ def setup(app: Sphinx):
 
     return {
         'version': '0.2',
+        'env_version': 5,
         'parallel_read_safe': True,
         'parallel_write_safe': True,
     }
@@ -0,0 +1,12 @@
+"""
+Benchmarks of sphinx_literate on synthetic corpora, to measure the hot paths
+of the extension without building the whole book:
+
+    cd _extensions
+    python -m sphinx_literate.benchmarks --documents 80 --output bench.json
+    python -m sphinx_literate.benchmarks --compare bench.json
+
+Each step (register_codeblock, merge, try_fixing_all_missing, get_rec,
+all_content, tangle and TangleBuilder.finish) is timed separately, and the
+results are written as JSON so that they can be compared between commits.
+"""
@@ -0,0 +1,97 @@
+from dataclasses import fields
+from datetime import datetime, timezone
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+
+from .corpus import CorpusConfig, generate_corpus
+from .suite import run_suite, EXTENSIONS_DIR
+
+#############################################################
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=EXTENSIONS_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def format_comparison(previous, current):
+    lines = [f"{'step':<24} {'previous':>12} {'current':>12} {'ratio':>8}"]
+    for step, result in current["results"].items():
+        before = previous["results"].get(step)
+        after_ms = result["min"] * 1000
+        if before is None:
+            lines.append(f"{step:<24} {'-':>12} {after_ms:>10.2f}ms {'-':>8}")
+            continue
+        before_ms = before["min"] * 1000
+        ratio = after_ms / before_ms if before_ms > 0 else float('inf')
+        lines.append(f"{step:<24} {before_ms:>10.2f}ms {after_ms:>10.2f}ms {ratio:>7.2f}x")
+    return lines
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m sphinx_literate.benchmarks",
+        description="Time the hot paths of sphinx_literate on a synthetic corpus.",
+    )
+    defaults = CorpusConfig()
+    for f in fields(CorpusConfig):
+        parser.add_argument(
+            "--" + f.name.replace("_", "-"),
+            type=type(getattr(defaults, f.name)),
+            default=getattr(defaults, f.name),
+            help=f"(default: {getattr(defaults, f.name)})",
+        )
+    parser.add_argument("--repeat", type=int, default=5, help="number of runs of each step, the minimum is reported (default: 5)")
+    parser.add_argument("--no-sphinx", action="store_true", help="skip TangleBuilder.finish, which requires building the corpus with Sphinx")
+    parser.add_argument("--output", help="JSON file to write the results to")
+    parser.add_argument("--compare", help="JSON file of previous results to compare with (the corpus options are read from it)")
+    args = parser.parse_args()
+
+    previous = None
+    if args.compare is not None:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            previous = json.load(f)
+        config = CorpusConfig(**previous["corpus"]["config"])
+    else:
+        config = CorpusConfig(**{f.name: getattr(args, f.name) for f in fields(CorpusConfig)})
+
+    corpus = generate_corpus(config)
+    if args.no_sphinx:
+        results = run_suite(corpus, args.repeat)
+    else:
+        with tempfile.TemporaryDirectory(prefix="lit-bench-") as workdir:
+            results = run_suite(corpus, args.repeat, workdir)
+
+    report = {
+        "commit": git_commit(),
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "corpus": {
+            "config": config.to_dict(),
+            "stats": corpus.stats(),
+        },
+        "results": results,
+    }
+
+    if previous is not None:
+        print("\n".join(format_comparison(previous, report)))
+    else:
+        for step, result in results.items():
+            print(f"{step:<24} {result['min'] * 1000:>10.2f}ms")
+
+    if args.output is not None:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,255 @@
+"""
+Generation of synthetic literate corpora, shaped like the book: chapters
+whose tangle root inherits from the one of the previous chapter, blocks that
+append to, replace or insert into blocks of previous chapters, and variant
+roots that receive the same blocks ('also for tangle root').
+"""
+
+from typing import Dict, List
+from dataclasses import dataclass, field, asdict
+from os.path import join
+import random
+
+from sphinx.util.osutil import ensuredir
+
+#############################################################
+
+@dataclass
+class CorpusConfig:
+    # Number of documents, each one defines its own tangle root
+    documents: int = 40
+
+    # Number of lit blocks per document (a few more may be needed to define
+    # all the blocks that are referenced)
+    blocks_per_document: int = 20
+
+    # Maximum number of references to new blocks in each block
+    references_per_block: int = 2
+
+    # Number of lines of code in each block, besides references
+    lines_per_block: int = 8
+
+    # Length of the chains of tangle roots (1 means no inheritance at all)
+    inheritance_depth: int = 10
+
+    # Probability for a block to modify an existing block rather than
+    # defining a new one, for each kind of modification.
+    append_ratio: float = 0.2
+    replace_ratio: float = 0.05
+    insert_ratio: float = 0.05
+
+    # Number of extra roots each block is also registered in
+    variant_roots: int = 1
+
+    # Seed of the random generator
+    seed: int = 0
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+#############################################################
+
+@dataclass
+class SyntheticBlock:
+    name: str
+
+    # Raw options as they appear in the title, e.g. 'append'
+    options: List[str] = field(default_factory=list)
+
+    content: List[str] = field(default_factory=list)
+
+    @property
+    def title(self) -> str:
+        options = f" ({', '.join(self.options)})" if self.options else ""
+        return f"C++, {self.name}{options}"
+
+@dataclass
+class SyntheticDocument:
+    docname: str
+
+    tangle_root: str
+
+    parent: str | None
+
+    # Variant roots, indexed by the alias used in block titles
+    variants: Dict[str,str]
+
+    # Parents of variant roots, indexed by alias
+    variant_parents: Dict[str,str|None]
+
+    blocks: List[SyntheticBlock] = field(default_factory=list)
+
+@dataclass
+class SyntheticCorpus:
+    config: CorpusConfig
+    documents: List[SyntheticDocument]
+
+    def stats(self) -> Dict:
+        blocks = [b for doc in self.documents for b in doc.blocks]
+        def count(kind):
+            return sum(1 for b in blocks if b.options and b.options[0].startswith(kind))
+        return {
+            "documents": len(self.documents),
+            "blocks": len(blocks),
+            "tangle_roots": sum(1 + len(doc.variants) for doc in self.documents),
+            "references": sum(1 for b in blocks for l in b.content if l.strip().startswith("{{")),
+            "append": count("append"),
+            "replace": count("replace"),
+            "insert": count("insert"),
+        }
+
+    def write_myst(self, srcdir: str, extensions_dir: str) -> None:
+        """
+        Write the corpus as a MyST Sphinx project
+        @param srcdir directory in which the project is written
+        @param extensions_dir directory containing the sphinx_literate package
+        """
+        ensuredir(srcdir)
+        with open(join(srcdir, "conf.py"), "w", encoding="utf-8") as f:
+            f.write("\n".join([
+                "import sys",
+                f"sys.path.append({extensions_dir!r})",
+                "project = 'Synthetic literate corpus'",
+                "extensions = ['myst_parser', 'sphinx_literate']",
+                "lit_begin_ref = '{{'",
+                "lit_end_ref = '}}'",
+                "",
+            ]))
+
+        with open(join(srcdir, "index.md"), "w", encoding="utf-8") as f:
+            f.write("\n".join(
+                ["# Synthetic literate corpus", "", "```{toctree}"]
+                + [doc.docname for doc in self.documents]
+                + ["```", ""]
+            ))
+
+        for doc in self.documents:
+            with open(join(srcdir, doc.docname + ".md"), "w", encoding="utf-8") as f:
+                f.write("\n".join(render_document(doc)))
+
+#############################################################
+
+def render_document(doc: SyntheticDocument) -> List[str]:
+    lines = [f"# {doc.tangle_root}", ""]
+
+    def setup(options):
+        lines.append("```{lit-setup}")
+        lines.extend(f":{key}: {value}" for key, value in options.items() if value is not None)
+        lines.extend(["```", ""])
+
+    setup({"tangle-root": doc.tangle_root, "parent": doc.parent})
+    for alias, root in doc.variants.items():
+        setup({"tangle-root": root, "parent": doc.variant_parents[alias], "alias": alias})
+
+    for block in doc.blocks:
+        lines.append(f"```{{lit}} {block.title}")
+        lines.extend(block.content)
+        lines.extend(["```", ""])
+    return lines
+
+#############################################################
+
+def anchor_line(name: str) -> str:
+    """
+    Line that all versions of a block contain, for other blocks to be
+    inserted after it.
+    """
+    return f"// [{name}]"
+
+def generate_corpus(config: CorpusConfig) -> SyntheticCorpus:
+    """
+    Generate a corpus that is guaranteed to tangle: blocks only reference
+    blocks created after them (so there is no cycle) and that are defined in
+    the same document, and insertions target a line that every version of
+    the target block contains.
+    """
+    rng = random.Random(config.seed)
+    depth = max(1, config.inheritance_depth)
+    aliases = [f"variant {v + 1}" for v in range(config.variant_roots)]
+
+    documents = []
+    chain_names: List[str] = []
+    previous = None
+    serial = 0
+
+    def code_lines(prefix, count):
+        return [f"int {prefix}_{j} = {j};" for j in range(count)]
+
+    for k in range(config.documents):
+        chain_start = k % depth == 0
+        root = f"{k:03d} - Synthetic chapter number {k}"
+        doc = SyntheticDocument(
+            docname = f"chapter-{k:03d}",
+            tangle_root = root,
+            parent = None if chain_start else previous.tangle_root,
+            variants = {alias: f"{root} - {alias}" for alias in aliases},
+            variant_parents = {
+                alias: None if chain_start else previous.variants[alias]
+                for alias in aliases
+            },
+        )
+        also_for = [f'also for tangle root "{alias}"' for alias in aliases]
+        if chain_start:
+            chain_names = []
+
+        pending: List[str] = []
+
+        def new_references(slots_left):
+            nonlocal serial
+            count = min(config.references_per_block, max(0, slots_left - len(pending) - 1))
+            refs = []
+            for _ in range(rng.randint(0, count) if count > 0 else 0):
+                serial += 1
+                name = f"Synthetic block {serial}"
+                pending.append(name)
+                refs.append(f"    {{{{{name}}}}}")
+            return refs
+
+        def add_block(name, options, anchor, slots_left):
+            content = []
+            if anchor:
+                content.append(anchor_line(name))
+            content += code_lines(f"v{k}_{len(doc.blocks)}", config.lines_per_block)
+            content += new_references(slots_left)
+            doc.blocks.append(SyntheticBlock(name, options + also_for, content))
+
+        budget = config.blocks_per_document
+        if chain_start:
+            add_block("file: main.cpp", [], True, budget)
+            chain_names.append("file: main.cpp")
+
+        while len(doc.blocks) < budget or pending:
+            slots_left = budget - len(doc.blocks)
+            modifiable = [n for n in chain_names if n not in pending]
+            r = rng.random()
+            if pending and (slots_left <= len(pending) or r < 0.5 or not modifiable):
+                name = pending.pop(0)
+                add_block(name, [], True, slots_left)
+                chain_names.append(name)
+                continue
+
+            r = rng.random()
+            if r < config.append_ratio:
+                add_block(rng.choice(modifiable), ["append"], False, slots_left)
+            elif r < config.append_ratio + config.replace_ratio:
+                targets = [n for n in modifiable if not n.startswith("file:")]
+                if not targets:
+                    continue
+                add_block(rng.choice(targets), ["replace"], True, slots_left)
+            elif r < config.append_ratio + config.replace_ratio + config.insert_ratio:
+                target = rng.choice(modifiable)
+                serial += 1
+                option = f'insert in {{{{{target}}}}} after "{anchor_line(target)}"'
+                add_block(f"Synthetic inserted block {serial}", [option], False, slots_left)
+            else:
+                # New block that nothing references, like many blocks that
+                # only exist to be displayed
+                serial += 1
+                name = f"Synthetic block {serial}"
+                add_block(name, [], True, slots_left)
+                chain_names.append(name)
+
+        documents.append(doc)
+        previous = doc
+
+    return SyntheticCorpus(config, documents)
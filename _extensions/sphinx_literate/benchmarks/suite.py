@@ -0,0 +1,210 @@
+"""
+Timing of the hot paths of sphinx_literate on a synthetic corpus. Documents
+are registered the same way LiterateDirective does, but without docutils, so
+that each step can be timed separately.
+"""
+
+from typing import Callable, Dict, List
+from types import SimpleNamespace
+from os.path import join, dirname, abspath
+import io
+import time
+
+from ..directives import get_tangle_roots_from_parsed_title
+from ..parse import parse_block_title, parse_block_content
+from ..registry import CodeBlock, CodeBlockRegistry, SourceLocation
+from ..tangle import tangle
+from .corpus import SyntheticCorpus, SyntheticDocument
+
+# Directory that contains the sphinx_literate package
+EXTENSIONS_DIR = dirname(dirname(dirname(abspath(__file__))))
+
+#############################################################
+# Reading
+
+def lit_config(begin_ref: str = "{{", end_ref: str = "}}"):
+    """Stand-in for the Sphinx config, with the only values the registry reads"""
+    return SimpleNamespace(lit_begin_ref=begin_ref, lit_end_ref=end_ref)
+
+def read_document(registry: CodeBlockRegistry, doc: SyntheticDocument, config, timer: Dict[str,float] | None = None) -> None:
+    """
+    Register the blocks of a document as LiterateSetupDirective and
+    LiterateDirective would.
+    @param timer if provided, the time spent in register_codeblock is added
+                 to its 'register_codeblock' entry
+    """
+    env = SimpleNamespace(temp_data={
+        'tangle-root': doc.tangle_root,
+        'tangle-aliases': dict(doc.variants),
+    })
+    if doc.parent is not None:
+        registry.set_tangle_parent(doc.tangle_root, doc.parent, SourceLocation(doc.docname, 0))
+    for alias, root in doc.variants.items():
+        parent = doc.variant_parents[alias]
+        if parent is not None:
+            registry.set_tangle_parent(root, parent, SourceLocation(doc.docname, 0))
+
+    elapsed = 0.0
+    for i, block in enumerate(doc.blocks):
+        parsed_title = parse_block_title(block.title)
+        tangle_roots = get_tangle_roots_from_parsed_title(parsed_title, env)
+        source_location = SourceLocation(doc.docname, i + 1)
+        content = tuple(block.content)
+        parsed_content = parse_block_content(content, config, f"{doc.docname}:{i}")
+        for j, tangle_root in enumerate(tangle_roots):
+            lit = CodeBlock(
+                name = parsed_title.name,
+                tangle_root = tangle_root,
+                source_location = source_location,
+                content = content,
+                target_id = f"lit-{i}-{j}",
+                lexer = parsed_title.lexer,
+            )
+            start = time.perf_counter()
+            registry.register_codeblock(lit, parsed_title.options)
+            elapsed += time.perf_counter() - start
+            for link in parsed_content.links(tangle_root).values():
+                registry.add_reference(lit.key, link.key, doc.docname)
+
+    if timer is not None:
+        timer['register_codeblock'] = timer.get('register_codeblock', 0.0) + elapsed
+
+def read_corpus_in_parallel(corpus: SyntheticCorpus, config) -> List[CodeBlockRegistry]:
+    """One registry per document, as when Sphinx reads in parallel"""
+    registries = []
+    for doc in corpus.documents:
+        registry = CodeBlockRegistry()
+        read_document(registry, doc, config)
+        registries.append(registry)
+    return registries
+
+def merge_all(registries: List[CodeBlockRegistry]) -> CodeBlockRegistry:
+    registry = CodeBlockRegistry()
+    for other in registries:
+        registry.merge(other)
+    return registry
+
+def read_corpus(corpus: SyntheticCorpus, config) -> CodeBlockRegistry:
+    registry = merge_all(read_corpus_in_parallel(corpus, config))
+    registry.finalize()
+    return registry
+
+#############################################################
+# Measures
+
+def measure(run: Callable[[], float], repeat: int) -> Dict:
+    """
+    @param run function that returns the time (in seconds) of one run
+    """
+    runs = [run() for _ in range(repeat)]
+    return {
+        "min": min(runs),
+        "mean": sum(runs) / len(runs),
+        "runs": runs,
+    }
+
+def timed(f: Callable[[], None]) -> float:
+    start = time.perf_counter()
+    f()
+    return time.perf_counter() - start
+
+def bench_register_codeblock(corpus, config) -> float:
+    timer = {}
+    registry = CodeBlockRegistry()
+    for doc in corpus.documents:
+        read_document(registry, doc, config, timer)
+    return timer['register_codeblock']
+
+def bench_merge(corpus, config) -> float:
+    registries = read_corpus_in_parallel(corpus, config)
+    return timed(lambda: merge_all(registries))
+
+def bench_try_fixing_all_missing(corpus, config) -> float:
+    registry = merge_all(read_corpus_in_parallel(corpus, config))
+    return timed(registry.try_fixing_all_missing)
+
+def bench_get_rec(registry: CodeBlockRegistry) -> float:
+    names = {key.name for key in registry.keys()}
+    roots = registry.all_tangle_roots()
+    def run():
+        for tangle_root in roots:
+            for name in names:
+                registry.get_rec(name, tangle_root)
+    return timed(run)
+
+def bench_all_content(registry: CodeBlockRegistry) -> float:
+    roots = registry.all_tangle_roots()
+    blocks = {
+        tangle_root: registry.blocks_by_root(tangle_root)
+        for tangle_root in roots
+    }
+    def run():
+        for tangle_root in roots:
+            for lit in blocks[tangle_root]:
+                for _ in lit.all_content(registry, tangle_root):
+                    pass
+    return timed(run)
+
+def bench_tangle(registry: CodeBlockRegistry, config) -> float:
+    roots = registry.all_tangle_roots()
+    file_blocks = {
+        tangle_root: [
+            lit
+            for lit in registry.blocks_by_root(tangle_root)
+            if lit.name.startswith("file:")
+        ]
+        for tangle_root in roots
+    }
+    def run():
+        for tangle_root in roots:
+            for lit in file_blocks[tangle_root]:
+                tangle(lit.name, tangle_root, registry, config)
+    return timed(run)
+
+def bench_tangle_builder_finish(corpus: SyntheticCorpus, workdir: str, repeat: int) -> Dict:
+    """
+    Build the corpus with the tangle builder, then time its finish() step,
+    which is where all the tangling happens.
+    """
+    from sphinx.application import Sphinx
+
+    srcdir = join(workdir, "src")
+    corpus.write_myst(srcdir, EXTENSIONS_DIR)
+    warnings = io.StringIO()
+    app = Sphinx(
+        srcdir,
+        srcdir,
+        join(workdir, "tangle"),
+        join(workdir, "doctrees"),
+        "tangle",
+        status=None,
+        warning=warnings,
+        freshenv=True,
+    )
+    app.build()
+    result = measure(lambda: timed(app.builder.finish), repeat)
+    result["warnings"] = warnings.getvalue().count("WARNING")
+    return result
+
+#############################################################
+
+def run_suite(corpus: SyntheticCorpus, repeat: int = 5, workdir: str | None = None) -> Dict:
+    """
+    Time each step on the corpus
+    @param workdir where to write the corpus as a Sphinx project to time
+                   TangleBuilder.finish (this step is skipped if None)
+    """
+    config = lit_config()
+    registry = read_corpus(corpus, config)
+
+    results = {
+        "register_codeblock": measure(lambda: bench_register_codeblock(corpus, config), repeat),
+        "merge": measure(lambda: bench_merge(corpus, config), repeat),
+        "try_fixing_all_missing": measure(lambda: bench_try_fixing_all_missing(corpus, config), repeat),
+        "get_rec": measure(lambda: bench_get_rec(registry), repeat),
+        "all_content": measure(lambda: bench_all_content(registry), repeat),
+        "tangle": measure(lambda: bench_tangle(registry, config), repeat),
+    }
+    if workdir is not None:
+        results["TangleBuilder.finish"] = bench_tangle_builder_finish(corpus, workdir, repeat)
+    return results
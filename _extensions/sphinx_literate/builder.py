@@ -5,16 +5,20 @@ from sphinx.builders import Builder
 from sphinx.locale import __
 from sphinx.util.osutil import ensuredir
 from sphinx.errors import ExtensionError
+from sphinx.util import logging
 
 from os.path import join, dirname, getmtime
-from typing import Any, Iterator, Set, Optional
+from typing import Any, Dict, Iterator, List, Set, Optional
 from zipfile import ZipFile
 import shutil
 import json
 
 from .registry import CodeBlock, CodeBlockRegistry
+from .snapshot import save_snapshot, SNAPSHOT_FILENAME
 from .tangle import tangle
 
+logger = logging.getLogger(__name__)
+
 #############################################################
 # Builder
 
@@ -63,77 +67,105 @@ class TangleBuilder(Builder):
         registry = CodeBlockRegistry.from_env(self.env)
         registry.try_fixing_all_missing()
 
-        for tangle_root in registry.all_tangle_roots():
-            self.processed_files = set()
-
-            # Tangle blocks
-            for lit in registry.blocks_by_root(tangle_root):
-                if lit.name.startswith("file:"):
-                    self.tangle_and_write(lit, tangle_root)
-
-            # Fetch extra code
-            fetch_files = registry.all_tangle_fetch_files(tangle_root)
-            for path, source_location in fetch_files:
-                if not path.exists():
-                    message = (
-                        f"Cannot fetch file {path} for tangle root {tangle_root} " +
-                        f"(in lit-setup directive from {source_location.format()})"
-                    )
-                    raise ExtensionError(message, modname="sphinx_literate")
-                self.fetch_file(path, tangle_root)
-
-        # Write the list of tangle roots
-        metadata = {
-            "roots": registry.all_tangle_roots(),
-        }
-        metadata_filename = join(self.outdir, "metadata.json")
-        with open(metadata_filename, "w", encoding="utf-8") as f:
-            json.dump(metadata, f, indent=2)
-
-    # Internal methods
-
-    def tangle_and_write(self, lit: CodeBlock, tangle_root: str | None):
-        """
-        NB: tangle_root is different from lit.tangle_root in case of inheritance
-        """
-        registry = CodeBlockRegistry.from_env(self.env)
-        assert(lit.name.startswith("file:"))
+        write_tangled_tree(registry, self.app.config, self.outdir)
+
+        if registry.stats is not None:
+            stats_filename = join(self.outdir, "registry-stats.json")
+            with open(stats_filename, "w", encoding="utf-8") as f:
+                json.dump(registry.stats.to_dict(), f, indent=2)
+
+#############################################################
+# Output, shared with tangle_cli and watch
+
+def write_tangled_tree(registry: CodeBlockRegistry, config, outdir: str) -> None:
+    """
+    Write the files of all tangle roots in outdir, as well as the list of
+    tangle roots in outdir/metadata.json and a snapshot of the registry.
+    @param config sphinx app config, or any object with lit_begin_ref and
+                  lit_end_ref attributes
+    """
+    for tangle_root in registry.all_tangle_roots():
+        # Tangle blocks
+        for filename, tangled_content in tangle_root_files(registry, tangle_root, config).items():
+            write_tangled_file(join(outdir, filename), tangled_content)
+
+        # Fetch extra code
+        fetch_root_files(registry, tangle_root, outdir)
+
+    write_metadata(registry, config, outdir)
+
+def tangle_root_files(registry: CodeBlockRegistry, tangle_root: str | None, config) -> Dict[str,List[str]]:
+    """
+    Tangle all the 'file:' blocks of a tangle root, including inherited ones.
+    @return tangled lines indexed by file name, relative to the output
+            directory (files with no content are skipped)
+    """
+    files = {}
+    processed_files = set()
+    for lit in registry.blocks_by_root(tangle_root):
+        if not lit.name.startswith("file:"):
+            continue
         filename = lit.name[len("file:"):].strip()
-        
+
         # Easy mistake guard
-        if filename in self.processed_files:
+        if filename in processed_files:
             message = (
                 f"There are two different blocks with a name 'file: {filename}' that " +
                 f"only differ from spaces after 'file:', this is likely a mistake."
             )
             raise ExtensionError(message, modname="sphinx_literate")
-        self.processed_files.add(filename)
+        processed_files.add(filename)
 
         if tangle_root is not None:
             filename = join(tangle_root, filename)
 
+        # NB: tangle_root is different from lit.tangle_root in case of inheritance
         tangled_content, root_lit = tangle(
             lit.name,
             tangle_root,
             registry,
-            self.app.config,
+            config,
             lit.source_location.format() + ", "
         )
 
-        if not tangled_content:
-            return
-
-        outfilename = join(self.outdir, filename)
-        ensuredir(dirname(outfilename))
-        try:
-            with open(outfilename, 'w', encoding='utf-8') as f:
-                f.write('\n'.join(tangled_content))
-        except OSError as err:
-            logger.warning(__("error writing file %s: %s"), outfilename, err)
-
-    def fetch_file(self, path, tangle_root):
-        if path.name.endswith(".zip"):
-            with ZipFile(path) as zf:
-                zf.extractall(join(self.outdir, tangle_root))
-        else:
-            shutil.copy(path, join(self.outdir, tangle_root))
+        if tangled_content:
+            files[filename] = tangled_content
+    return files
+
+def write_tangled_file(outfilename: str, tangled_content: List[str]) -> None:
+    ensuredir(dirname(outfilename))
+    try:
+        with open(outfilename, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(tangled_content))
+    except OSError as err:
+        logger.warning(__("error writing file %s: %s"), outfilename, err)
+
+def fetch_root_files(registry: CodeBlockRegistry, tangle_root: str | None, outdir: str) -> None:
+    fetch_files = registry.all_tangle_fetch_files(tangle_root)
+    for path, source_location in fetch_files:
+        if not path.exists():
+            message = (
+                f"Cannot fetch file {path} for tangle root {tangle_root} " +
+                f"(in lit-setup directive from {source_location.format()})"
+            )
+            raise ExtensionError(message, modname="sphinx_literate")
+        fetch_file(path, tangle_root, outdir)
+
+def fetch_file(path, tangle_root, outdir: str) -> None:
+    if path.name.endswith(".zip"):
+        with ZipFile(path) as zf:
+            zf.extractall(join(outdir, tangle_root))
+    else:
+        shutil.copy(path, join(outdir, tangle_root))
+
+def write_metadata(registry: CodeBlockRegistry, config, outdir: str) -> None:
+    # Write the list of tangle roots
+    metadata = {
+        "roots": registry.all_tangle_roots(),
+    }
+    metadata_filename = join(outdir, "metadata.json")
+    with open(metadata_filename, "w", encoding="utf-8") as f:
+        json.dump(metadata, f, indent=2)
+
+    # For querying blocks without building again (see query.py)
+    save_snapshot(registry, config, join(outdir, SNAPSHOT_FILENAME))
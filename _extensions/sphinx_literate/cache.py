@@ -0,0 +1,138 @@
+from typing import Any, Dict
+from os.path import join, getsize
+import hashlib
+import os
+import time
+
+import pygments
+from sphinx.highlighting import lexers
+from sphinx.util.osutil import ensuredir
+
+#############################################################
+
+class HighlightCache:
+    """
+    Content-addressed on-disk cache of highlighted code blocks. Each entry is
+    a file named after the hash of everything that may affect the output of
+    the highlighter. Least recently used entries are evicted by prune() once
+    the cache exceeds its maximum size.
+    """
+
+    def __init__(self, directory: str, max_size: int) -> None:
+        self.directory = directory
+        self.max_size = max_size
+        ensuredir(self.directory)
+
+    def path(self, key: str) -> str:
+        return join(self.directory, key[:2], key)
+
+    def get(self, key: str) -> str | None:
+        path = self.path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                value = f.read()
+        except OSError:
+            return None
+        # Mark as recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        path = self.path(key)
+        ensuredir(join(self.directory, key[:2]))
+        # Write then rename so that parallel writers never see partial entries
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(value)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass
+
+    def prune(self) -> None:
+        """Evict least recently used entries until the cache fits max_size"""
+        entries = []
+        total_size = 0
+        for dirpath, _, filenames in os.walk(self.directory):
+            for filename in filenames:
+                path = join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if filename.endswith(".tmp") and stat.st_mtime < time.time() - 3600:
+                    # Leftover from an interrupted build
+                    os.remove(path)
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total_size += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+                total_size -= size
+            except OSError:
+                pass
+
+#############################################################
+
+def lexer_signature(lang: str) -> str | None:
+    """
+    Describe the lexer registered for a language, including its filters (e.g.
+    the VisibleWhitespaceFilter installed by the style extension), or None if
+    the lexer has not been created yet.
+    """
+    lexer = lexers.get(lang)
+    if lexer is None:
+        return None
+    filters = [
+        f"{type(f).__name__}{sorted(vars(f).items())!r}"
+        for f in lexer.filters
+    ]
+    return f"{type(lexer).__name__}{sorted(lexer.options.items())!r}{filters!r}"
+
+class CachedHighlighter:
+    """
+    Wraps a Sphinx highlighter (PygmentsBridge) and caches the result of
+    highlight_block in a HighlightCache.
+    NB: Warnings emitted by Pygments are only reported when the block is
+    actually highlighted, not when it is fetched from the cache.
+    """
+
+    def __init__(self, original_highlighter, cache: HighlightCache, config) -> None:
+        self._original_highlighter = original_highlighter
+        self.cache = cache
+        self.context = repr((
+            pygments.__version__,
+            type(original_highlighter.formatter).__name__,
+            original_highlighter.dest,
+            config.pygments_style,
+            getattr(config, 'pygments_dark_style', None),
+            config.trim_doctest_flags,
+        ))
+
+    def __getattr__(self, name: str) -> Any:
+        # Forward everything else (get_stylesheet, get_lexer, ...)
+        return getattr(self._original_highlighter, name)
+
+    def highlight_block(self, source: str, lang: str, location: Any = None, **kwargs: Any) -> str:
+        signature = lexer_signature(lang)
+        if signature is None:
+            # Lexer not created yet, so we cannot tell which filters it uses
+            return self._original_highlighter.highlight_block(source, lang, location=location, **kwargs)
+
+        key = hashlib.sha256(
+            repr((self.context, signature, lang, sorted(kwargs.items(), key=lambda kv: kv[0]), source)).encode()
+        ).hexdigest()
+
+        highlighted = self.cache.get(key)
+        if highlighted is None:
+            highlighted = self._original_highlighter.highlight_block(source, lang, location=location, **kwargs)
+            self.cache.set(key, highlighted)
+        return highlighted
@@ -6,3 +6,16 @@ def setup(app):
 
     # Turn this to False if you want to define your own style (js and css files)
     app.add_config_value("lit_use_default_style", True, 'html', [bool])
+
+    # Maximum size (in bytes) of the on-disk cache of highlighted code blocks,
+    # set to 0 to disable the cache.
+    app.add_config_value("lit_highlight_cache_size", 64 * 1024 * 1024, 'html', [int])
+
+    # Turn this to True to move hidden blocks out of the HTML pages, into
+    # fragments that are only loaded when the reader shows hidden blocks.
+    app.add_config_value("lit_defer_hidden_blocks", False, 'env', [bool])
+
+    # Turn this to True to count lookups and tangling work in the registry,
+    # which are shown by {lit-registry} with the :stats: option and written
+    # in registry-stats.json by the tangle builder (see stats.py).
+    app.add_config_value("lit_registry_stats", False, '', [bool])
@@ -1,4 +1,5 @@
 from typing import List
+import sys
 
 from docutils import nodes
 from docutils.nodes import Node, Element
@@ -12,7 +13,7 @@ from sphinx.application import Sphinx
 
 from .parse import parse_block_content, parse_block_title, parse_fetched_files, ParsedBlockTitle
 from .registry import CodeBlock, CodeBlockRegistry, SourceLocation
-from .nodes import LiterateNode, TangleNode, RegistryNode
+from .nodes import LiterateNode, TangleNode, RegistryNode, HiddenBlockNode
 
 #############################################################
 
@@ -25,7 +26,7 @@ def get_tangle_roots_from_parsed_title(parsed_title: ParsedBlockTitle, env) -> L
 
     tangle_roots = [ env.temp_data.get('tangle-root') ]
     for opt in parsed_title.options:
-        if type(opt) == tuple and opt[0] == 'TANGLE ROOT':
+        if isinstance(opt, tuple) and opt[0] == 'TANGLE ROOT':
             if opt[1] == 'REPLACE':
                 tangle_roots = []
             tangle_roots.append(tangle_aliases.get(opt[2], opt[2]))
@@ -101,6 +102,9 @@ class TangleDirective(SphinxCodeBlock):
         self.content = StringList(["Hello, world"])
         self.arguments = [parsed_title.lexer] if parsed_title.lexer is not None else []
 
+        # The tangled content comes from other documents
+        self.env.note_reread()
+
         raw_block_node = super().run()[0]
 
         return [
@@ -123,14 +127,24 @@ class RegistryDirective(SphinxCodeBlock):
     """
     This is close to the tangle directive, in the fact that it creates a code
     block that will be populated only.
+    With the 'stats' option, it also shows the statistics collected when
+    lit_registry_stats is True.
     """
 
     required_arguments = 0
     optional_arguments = 0
+    option_spec: OptionSpec = {
+        **SphinxCodeBlock.option_spec,
+        'stats': directives.flag,
+    }
 
     def run(self):
+        show_stats = 'stats' in self.options
         raw_block_node = super().run()[0]
 
+        # The registry depends on all documents
+        self.env.note_reread()
+
         return [
             RegistryNode(
                 SourceLocation(
@@ -138,6 +152,7 @@ class RegistryDirective(SphinxCodeBlock):
                     lineno = self.lineno,
                 ),
                 raw_block_node,
+                show_stats,
             )
         ]
 
@@ -157,9 +172,23 @@ class LiterateDirective(SphinxCodeBlock):
 
         lit_codeblocks = CodeBlockRegistry.from_env(self.env)
 
+        # Shared by the blocks of all tangle roots, the content is parsed
+        # only once and links are bound to each root afterwards.
+        source_location = SourceLocation(
+            docname = sys.intern(self.env.docname),
+            lineno = self.lineno,
+        )
+        content = tuple(self.content)
+        uid_seed = f"{self.env.docname}:{self.env.new_serialno('lit-content')}"
+        parsed_content = parse_block_content(
+            content,
+            self.config,
+            uid_seed,
+            location=(self.env.docname, self.lineno + 1),
+        )
+
         all_targetnodes = []
         for tangle_root in all_tangle_roots:
-            parsed_content = parse_block_content(self.content, tangle_root, self.config)
 
             targetid = 'lit-%d' % self.env.new_serialno('lit')
             targetnode = nodes.target('', '', ids=[targetid])
@@ -167,30 +196,34 @@ class LiterateDirective(SphinxCodeBlock):
             lit = CodeBlock(
                 name = parsed_title.name,
                 tangle_root = tangle_root,
-                source_location = SourceLocation(
-                    docname = self.env.docname,
-                    lineno = self.lineno,
-                ),
-                content = self.content,
-                target = targetnode,
+                source_location = source_location,
+                content = content,
+                target_id = targetid,
                 lexer = parsed_title.lexer,
             )
 
             # Register
             lit_codeblocks.register_codeblock(lit, parsed_title.options)
-            for ref in parsed_content.uid_to_block_link.values():
-                lit_codeblocks.add_reference(lit.key, ref.key)
+            for link in parsed_content.links(tangle_root).values():
+                lit_codeblocks.add_reference(lit.key, link.key, self.env.docname)
 
             all_targetnodes.append(targetnode)
             if tangle_root == primary_tangle_root:
                 self.lit = lit
-                self.parsed_content = parsed_content
+
+        self.parsed_content = parsed_content
 
         # Call parent for generating a regular code block
         self.content = StringList(self.parsed_content.content)
         self.arguments = [parsed_title.lexer] if parsed_title.lexer is not None else []
         block_node = self.create_block_node()
 
+        if self.lit.hidden and self.config.lit_defer_hidden_blocks:
+            hidden_node = HiddenBlockNode()
+            hidden_node['block_id'] = self.lit.target_id
+            hidden_node += block_node
+            block_node = hidden_node
+
         return all_targetnodes + [block_node]
 
     def create_block_node(self):
@@ -222,8 +255,8 @@ class LiterateDirective(SphinxCodeBlock):
         Wrap Sphinx literal node with our literate node, which contains context
         about what reference links to insert during the final translation.
         """
-        literate_node = LiterateNode(raw_literal_node, self.lit)
-        literate_node.uid_to_block_link = self.parsed_content.uid_to_block_link
+        literate_node = LiterateNode(raw_literal_node, self.lit.uid)
+        literate_node.uid_to_block_link = self.parsed_content.links(self.lit.tangle_root)
         return literate_node
 
 #############################################################
@@ -1,14 +1,19 @@
-from typing import Dict, Any
+from typing import Dict, Any, List, Set
 from os.path import dirname, join
+import hashlib
+import json
 
 from sphinx.application import Sphinx
 from sphinx.locale import _
 from sphinx.util.fileutil import copy_asset_file
+from sphinx.util.osutil import ensuredir
 from sphinx.environment.adapters.toctree import TocTree
 
 from .registry import CodeBlock, CodeBlockRegistry
+from .stats import RegistryStats
 from .nodes import LiterateNode, TangleNode, RegistryNode
 from .tangle import tangle
+from .cache import HighlightCache, CachedHighlighter
 from .utils import print_traceback
 
 from docutils import nodes
@@ -21,6 +26,89 @@ def purge_registry(app: Sphinx, env, docname: str):
     registry = CodeBlockRegistry.from_env(env)
     registry.remove_codeblocks_by_docname(docname)
 
+@print_traceback
+def purge_registry_before_reading(app: Sphinx, env, docnames: List[str]):
+    # Sphinx purges each document right before reading it, but the blocks of
+    # all the documents read again must be removed before registering any of
+    # them (see CodeBlockRegistry.docnames_to_read_again).
+    registry = CodeBlockRegistry.from_env(env)
+    registry.remove_codeblocks_by_docnames(set(docnames))
+
+@print_traceback
+def get_docnames_to_read_again(app: Sphinx, env, added: Set[str], changed: Set[str], removed: Set[str]):
+    """
+    Documents that are chained to the blocks of changed or removed documents
+    must be read again for the chains to be registered in the right order.
+    """
+    registry = CodeBlockRegistry.from_env(env)
+    return registry.docnames_to_read_again(changed | removed) - removed
+
+####################################################
+
+def literate_metadata_digests(registry: CodeBlockRegistry) -> Dict[str,str]:
+    """
+    Digest, for each document, of what the rendering of its literate blocks
+    takes from other documents: the previous and next blocks of their chain
+    (see LiterateNode's html visitor), the blocks that reference them and the
+    targets of their references.
+    Only valid after finalize()
+    """
+    def describe(lit: CodeBlock | None):
+        if lit is None:
+            return None
+        return (
+            lit.name,
+            lit.source_location.docname,
+            lit.target_id,
+            lit.lexer,
+            lit.relation_to_prev,
+            repr(lit.inserted_location),
+        )
+
+    data_by_docname = {}
+    for head in registry.blocks():
+        lit = head
+        while lit is not None:
+            data_by_docname.setdefault(lit.source_location.docname, []).append((
+                describe(lit),
+                lit.hidden,
+                describe(lit.prev),
+                describe(lit.prev.prev if lit.prev is not None else None),
+                describe(lit.next),
+                [describe(ref) for ref in registry.resolved_references(lit.key)],
+            ))
+            lit = lit.next
+
+    digests = {}
+    for docname, data in data_by_docname.items():
+        links = sorted(
+            (str(key), describe(lit))
+            for key, lit in registry.resolved_links(docname).items()
+        )
+        digests[docname] = hashlib.sha256(repr((data, links)).encode()).hexdigest()
+    return digests
+
+@print_traceback
+def get_docnames_with_outdated_metadata(app: Sphinx, env):
+    """
+    Documents that were not read again but whose literate blocks link to
+    blocks that changed, so they must be written again.
+    """
+    registry = CodeBlockRegistry.from_env(env)
+    registry.finalize()
+    digests = literate_metadata_digests(registry)
+    previous_digests = getattr(env, 'lit_metadata_digests', None)
+    env.lit_metadata_digests = digests
+    if previous_digests is None:
+        # First build, all documents are written anyway
+        return []
+    return sorted(
+        docname
+        for docname in digests.keys() | previous_digests.keys()
+        if digests.get(docname) != previous_digests.get(docname)
+        and docname in env.found_docs
+    )
+
 ####################################################
 
 @print_traceback
@@ -30,33 +118,37 @@ def merge_registry(app, env, docnames, other):
 
 ####################################################
 
+@print_traceback
+def finalize_registry(app: Sphinx, env):
+    # Done once before writing rather than for each resolved doctree (and
+    # before forking when writing in parallel).
+    registry = CodeBlockRegistry.from_env(env)
+    registry.finalize()
+
+####################################################
+
 @print_traceback
 def process_literate_nodes(app: Sphinx, doctree, fromdocname: str):
     registry = CodeBlockRegistry.from_env(app.builder.env)
-    registry.try_fixing_all_missing()
-    registry.check_integrity()
+    registry.finalize()
 
     has_literate_node = False
     for literate_node in doctree.findall(LiterateNode):
         has_literate_node = True
+        literate_node.lit = registry.get_by_uid(literate_node.lit_uid)
+        resolved_links = registry.resolved_links(fromdocname)
 
         # This check should not be needed if the registry was doing its job...
         for uid, link in literate_node.uid_to_block_link.items():
-            if registry.get_rec_by_key(link.key) is None:
-                missing_tangle_root, missing_name = link.key.split("##")
+            if resolved_links.get(link.key) is None:
+                missing_tangle_root, missing_name = link.key
                 raise ExtensionError(f"Reference to an invalid block: '{missing_name}' (in tangle root '{missing_tangle_root}')")
 
         literate_node.uid_to_lit = {
-            uid: (registry.get_rec_by_key(link.key), link.options)
+            uid: (resolved_links[link.key], link.options)
             for uid, link in literate_node.uid_to_block_link.items()
         }
-        literate_node.references = [
-            registry.get_by_key(k)
-            for k in registry.references_to_key(literate_node.lit.key)
-        ]
-
-        # Fix references broken by serialization
-        literate_node.lit = registry.get_by_uid(literate_node.lit.uid)
+        literate_node.references = registry.resolved_references(literate_node.lit.key)
 
     for tangle_node in doctree.findall(TangleNode):
 
@@ -101,14 +193,48 @@ def process_literate_nodes(app: Sphinx, doctree, fromdocname: str):
 
     registry_dump = registry.pretty_dump()
     for registry_node in doctree.findall(RegistryNode):
+        lines = registry_dump
+        if registry_node.show_stats:
+            lines = lines + [""]
+            if registry.stats is not None:
+                lines += registry.stats.pretty_dump()
+            else:
+                lines += ["Registry statistics are disabled, set lit_registry_stats = True to collect them."]
         block_node = registry_node.raw_block_node
-        block_node.rawsource = '\n'.join(registry_dump)
+        block_node.rawsource = '\n'.join(lines)
         block_node.children.clear()
         block_node.children.append(nodes.Text(block_node.rawsource))
         registry_node.replace_self([block_node])
 
 ####################################################
 
+@print_traceback
+def enable_registry_stats(app: Sphinx):
+    if app.config.lit_registry_stats:
+        registry = CodeBlockRegistry.from_env(app.env)
+        registry.stats = RegistryStats()
+
+####################################################
+
+@print_traceback
+def setup_highlight_cache(app: Sphinx):
+    highlighter = getattr(app.builder, 'highlighter', None)
+    if highlighter is None or app.config.lit_highlight_cache_size <= 0:
+        return
+    cache = HighlightCache(
+        join(app.doctreedir, "lit_highlight_cache"),
+        app.config.lit_highlight_cache_size,
+    )
+    app.builder.highlighter = CachedHighlighter(highlighter, cache, app.config)
+
+@print_traceback
+def prune_highlight_cache(app: Sphinx, exc):
+    highlighter = getattr(app.builder, 'highlighter', None)
+    if isinstance(highlighter, CachedHighlighter):
+        highlighter.cache.prune()
+
+####################################################
+
 @print_traceback
 def copy_custom_files(app: Sphinx, exc):
     if app.config.lit_use_default_style:
@@ -139,12 +265,47 @@ def html_page_context(
     found_lit_block = builder.env.lit_doc_contains_block.get(docname, False)
     context["lit_show_options"] = found_lit_block
 
+    write_page_metadata(app, docname, context)
+
+def write_page_metadata(app: Sphinx, docname: str, context: Dict[str, Any]):
+    """
+    Write the metadata of the literate blocks of a page (collected while
+    visiting its LiterateNodes) and its deferred hidden blocks into compact
+    JSON files, and reference them from the page's meta tags.
+    """
+    builder = app.builder
+
+    metadata = getattr(builder, 'lit_page_metadata', {}).pop(docname, None)
+    if metadata:
+        write_page_json(app, context, f"_lit/{docname}.json", "lit-metadata", metadata)
+
+    # Deferred hidden blocks (see HiddenBlockNode)
+    hidden_blocks = getattr(builder, 'lit_page_hidden_blocks', {}).pop(docname, None)
+    if hidden_blocks:
+        write_page_json(app, context, f"_lit/{docname}.hidden.json", "lit-hidden-blocks", hidden_blocks)
+
+def write_page_json(app: Sphinx, context: Dict[str, Any], relative_filename: str, meta_name: str, data: Any):
+    filename = join(app.builder.outdir, relative_filename)
+    ensuredir(dirname(filename))
+    with open(filename, "w", encoding="utf-8") as f:
+        json.dump(data, f, separators=(',', ':'))
+
+    url = context["pathto"](relative_filename, 1)
+    context["metatags"] = context.get("metatags", "") + f'\n<meta name="{meta_name}" content="{url}" />'
+
 #############################################################
 # Setup
 
 def setup(app):
     app.connect('doctree-resolved', process_literate_nodes)
+    app.connect('env-get-outdated', get_docnames_to_read_again)
     app.connect('env-purge-doc', purge_registry)
+    app.connect('env-before-read-docs', purge_registry_before_reading)
     app.connect('env-merge-info', merge_registry)
+    app.connect('env-updated', finalize_registry)
+    app.connect('env-updated', get_docnames_with_outdated_metadata)
+    app.connect('builder-inited', enable_registry_stats)
+    app.connect('builder-inited', setup_highlight_cache)
     app.connect('build-finished', copy_custom_files)
+    app.connect('build-finished', prune_highlight_cache)
     app.connect('html-page-context', html_page_context)
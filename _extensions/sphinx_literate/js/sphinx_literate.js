@@ -276,6 +276,40 @@ class LitRef extends HTMLElement {
 
 customElements.define("lit-ref", LitRef);
 
+/**
+ * The metadata of all literate blocks of the page is stored in a separate
+ * JSON file (indexed by block id), only fetched once the first block info
+ * is displayed.
+ */
+let litMetadataPromise = null;
+function loadLitMetadata() {
+	if (litMetadataPromise === null) {
+		const meta = document.querySelector('meta[name="lit-metadata"]');
+		if (meta === null) {
+			litMetadataPromise = Promise.resolve({});
+		} else {
+			litMetadataPromise = fetch(meta.getAttribute("content"))
+				.then(response => response.json())
+				.catch(err => {
+					console.error("Could not load literate metadata: " + err);
+					return {};
+				});
+		}
+	}
+	return litMetadataPromise;
+}
+
+const litBlockInfoObserver = new IntersectionObserver(function(entries, observer) {
+	if (!entries.some(entry => entry.isIntersecting)) return;
+	// Loading the metadata for one block loads it for all of them
+	observer.disconnect();
+	loadLitMetadata().then(metadata => {
+		document.querySelectorAll("lit-block-info").forEach(element => {
+			element.setData(metadata[element.getAttribute("block-id")]);
+		});
+	});
+});
+
 class LitBlockInfo extends HTMLElement {
 	constructor() {
 		super();
@@ -285,7 +319,7 @@ class LitBlockInfo extends HTMLElement {
 		this.styleElement = document.createElement("style");
 		this.styleElement.textContent = commonStyle + litBlockInfoStyle;
 
-		this.rebuildShadow();
+		this.data = null;
 
 		// Callbacks
 		document.addEventListener(options.changedEvent.type, (function() {
@@ -293,8 +327,20 @@ class LitBlockInfo extends HTMLElement {
 		}).bind(this));
 	}
 
+	connectedCallback() {
+		if (this.data === null) {
+			litBlockInfoObserver.observe(this);
+		}
+	}
+
+	setData(data) {
+		this.data = data === undefined ? null : data;
+		this.rebuildShadow();
+	}
+
 	rebuildShadow() {
-		const data = JSON.parse(this.getAttribute("data"));
+		const data = this.data;
+		if (data === null) return;
 
 		const wrapper = document.createElement("div");
 		wrapper.setAttribute("class", "wrapper");
@@ -320,7 +366,8 @@ class LitBlockInfo extends HTMLElement {
 				'inserted in'
 			];
 			details.map(section => {
-				if (data[section].length > 0) {
+				// Empty sections are omitted from the metadata
+				if (data[section] !== undefined && data[section].length > 0) {
 					info.append(document.createTextNode(" " + section + " "));
 					data[section].map(lit => {
 						info.append(...this.createLitLink(lit.name, lit.url));
@@ -353,6 +400,57 @@ class LitBlockInfo extends HTMLElement {
 
 customElements.define("lit-block-info", LitBlockInfo);
 
+/**
+ * Placeholder for a hidden block whose HTML is only fetched when the reader
+ * enables hidden blocks (when lit_defer_hidden_blocks is on).
+ */
+let litHiddenBlocksPromise = null;
+function loadLitHiddenBlocks() {
+	if (litHiddenBlocksPromise === null) {
+		const meta = document.querySelector('meta[name="lit-hidden-blocks"]');
+		if (meta === null) {
+			litHiddenBlocksPromise = Promise.resolve({});
+		} else {
+			litHiddenBlocksPromise = fetch(meta.getAttribute("content"))
+				.then(response => response.json())
+				.catch(err => {
+					console.error("Could not load hidden literate blocks: " + err);
+					return {};
+				});
+		}
+	}
+	return litHiddenBlocksPromise;
+}
+
+class LitHiddenBlock extends HTMLElement {
+	constructor() {
+		super();
+
+		this.onOptionsChanged = this.maybeLoad.bind(this);
+	}
+
+	connectedCallback() {
+		document.addEventListener(options.changedEvent.type, this.onOptionsChanged);
+		this.maybeLoad();
+	}
+
+	disconnectedCallback() {
+		document.removeEventListener(options.changedEvent.type, this.onOptionsChanged);
+	}
+
+	maybeLoad() {
+		if (!options.get('showHiddenBlocks')) return;
+		loadLitHiddenBlocks().then(fragments => {
+			const fragment = fragments[this.getAttribute("block-id")];
+			if (fragment !== undefined && this.isConnected) {
+				this.outerHTML = fragment;
+			}
+		});
+	}
+}
+
+customElements.define("lit-hidden-block", LitHiddenBlock);
+
 const literateBtnTemplate = `
 <button title="Literate options">
 	<svg aria-hidden="true" viewBox="0 0 67.733333 67.733334" stroke-width="3.54809" stroke="currentColor" fill="currentColor" stroke-linecap="butt" stroke-linejoin="round">
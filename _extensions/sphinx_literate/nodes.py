@@ -1,9 +1,9 @@
 from docutils import nodes
 
-import html
-import json
+from collections import defaultdict
 
 from .registry import Key, CodeBlock, SourceLocation
+from .parse import UID_PATTERN
 
 #############################################################
 
@@ -20,14 +20,55 @@ class TangleNode(nodes.General, nodes.Element):
 #############################################################
 
 class RegistryNode(nodes.General, nodes.Element):
-    def __init__(self, source_location, raw_block_node, *args):
+    def __init__(self, source_location, raw_block_node, show_stats=False, *args):
         self.source_location = source_location
         self.raw_block_node = raw_block_node
+        self.show_stats = show_stats
 
         super().__init__(*args)
 
 #############################################################
 
+class HiddenBlockNode(nodes.General, nodes.Element):
+    """
+    Wraps a hidden literate block when lit_defer_hidden_blocks is on. The html
+    translator moves its content to a per-page fragment file and leaves only
+    a placeholder in the page, that the js fills when hidden blocks are shown.
+    """
+
+    @classmethod
+    def build_translation_handlers(cls, app):
+        def visit_passthrough(self, node):
+            pass
+
+        def depart_passthrough(self, node):
+            pass
+
+        def visit_html(self, node):
+            node['body_start'] = len(self.body)
+
+        def depart_html(self, node):
+            start = node['body_start']
+            fragment = ''.join(self.body[start:])
+            del self.body[start:]
+
+            if not hasattr(self.builder, 'lit_page_hidden_blocks'):
+                self.builder.lit_page_hidden_blocks = defaultdict(dict)
+            block_id = node['block_id']
+            self.builder.lit_page_hidden_blocks[self.builder.current_docname][block_id] = fragment
+            self.body.append(
+                f'<lit-hidden-block block-id="{block_id}"></lit-hidden-block>'
+            )
+
+        handlers = {
+            name: (visit_passthrough, depart_passthrough)
+            for name in app.registry.builders
+        }
+        handlers['html'] = (visit_html, depart_html)
+        return handlers
+
+#############################################################
+
 class LiterateHighlighter:
     """
     A custom code block highlighter that uses an existing highlighter and
@@ -43,24 +84,40 @@ class LiterateHighlighter:
 
         highlighted = self._original_highlighter.highlight_block(rawsource, lang, **kwargs)
 
-        # Post-process: Replace hashes with links
-        for uid, (lit, options) in self.node.uid_to_lit.items():
-            ref = self.ref_factory(self.node, lit, options)
-            highlighted = highlighted.replace(uid, ref)
-
-        return highlighted
+        # Post-process: Replace hashes with links, in a single pass
+        uid_to_lit = self.node.uid_to_lit
+        if not uid_to_lit:
+            return highlighted
+
+        refs = {}
+        def replace(match):
+            uid = match.group(0)
+            ref = refs.get(uid)
+            if ref is None:
+                entry = uid_to_lit.get(uid)
+                if entry is None:
+                    # Not one of our uids, just looks like one
+                    return uid
+                lit, options = entry
+                ref = refs[uid] = self.ref_factory(self.node, lit, options)
+            return ref
+
+        return UID_PATTERN.sub(replace, highlighted)
 
 #############################################################
 
 class LiterateNode(nodes.General, nodes.Element):
-    def __init__(self, literal_node, lit: CodeBlock, *args):
+    def __init__(self, literal_node, lit_uid: str, *args):
         """
         We wrap a literal node and insert links to references code blocks
         """
         self._literal_node = literal_node
         self.uid_to_block_link = {}
         self.uid_to_lit = {}
-        self.lit = lit
+        # Only the uid of the block is stored in the doctree, the block itself
+        # (which is linked to many others) is set when the doctree is resolved.
+        self.lit_uid = lit_uid
+        self.lit: CodeBlock | None = None
         self.references: List[CodeBlock] = []
         super().__init__(*args)
 
@@ -104,20 +161,37 @@ class LiterateNode(nodes.General, nodes.Element):
             refnode['refdocname'] = lit.docname
             refnode['refuri'] = (
                 app.builder.get_relative_uri(node.document['source'], lit.docname)
-                + '#' + lit.target['refid']
+                + '#' + lit.target_id
             )
             refnode.append(nodes.Text(lit.name))
             """
-            url = lit.link_url(node.lit.source_location.docname, app.builder)
-            lexer = f'"{lit.lexer}"' if lit.lexer is not None else "null"
-            hidden = "true" if 'HIDDEN' in options else "false"
-            return (
-                f'<lit-ref name="{lit.name}" href="{url}" lexer={lexer} hidden-link="{hidden}">' +
-                    app.config.lit_begin_ref +
-                        f'<a href="{url}">{lit.name}</a>' +
-                    app.config.lit_end_ref +
-                '</lit-ref>'
+            builder = app.builder
+            fromdocname = node.lit.source_location.docname
+            hidden = 'HIDDEN' in options
+
+            # The markup only depends on the target block, the document it
+            # is used from and the hidden option, so we build it only once.
+            # NB: The location of a block does not identify it, INSERT
+            # modifiers share it with the inserted block.
+            if not hasattr(builder, 'lit_ref_markup'):
+                builder.lit_ref_markup = {}
+            key = (
+                lit.source_location.docname, lit.target_id, lit.name, lit.tangle_root, lit.lexer,
+                fromdocname, hidden,
             )
+            markup = builder.lit_ref_markup.get(key)
+            if markup is None:
+                url = lit.link_url(fromdocname, builder)
+                lexer = f'"{lit.lexer}"' if lit.lexer is not None else "null"
+                hidden_str = "true" if hidden else "false"
+                markup = builder.lit_ref_markup[key] = (
+                    f'<lit-ref name="{lit.name}" href="{url}" lexer={lexer} hidden-link="{hidden_str}">' +
+                        app.config.lit_begin_ref +
+                            f'<a href="{url}">{lit.name}</a>' +
+                        app.config.lit_end_ref +
+                    '</lit-ref>'
+                )
+            return markup
 
         def visit_html(self, node):
             # Override highlighter
@@ -144,15 +218,17 @@ class LiterateNode(nodes.General, nodes.Element):
             docname = node.lit.source_location.docname
 
             def make_link_metadata(lit, details = None):
-                return {
+                link_metadata = {
                     'name': lit.name,
                     'url': lit.link_url(docname, self.builder),
-                    'details': details,
                 }
+                if details is not None:
+                    link_metadata['details'] = details
+                return link_metadata
 
             metadata = {
                 'name': node.lit.name,
-                'permalink': "#" + node.lit.target['refid'],
+                'permalink': "#" + node.lit.target_id,
                 'hidden': node.lit.hidden,
                 'replaced by': [],
                 'completed in': [],
@@ -208,9 +284,19 @@ class LiterateNode(nodes.General, nodes.Element):
                     make_link_metadata(ref)
                 )
 
-            encoded_metadata = html.escape(json.dumps(metadata))
+            # Only the block id is kept in the markup, the metadata of all the
+            # blocks of a page is written to a separate file that the js loads
+            # lazily (see handlers.write_page_metadata).
+            block_id = node.lit.target_id
+            if not hasattr(self.builder, 'lit_page_metadata'):
+                self.builder.lit_page_metadata = defaultdict(dict)
+            self.builder.lit_page_metadata[self.builder.current_docname][block_id] = {
+                key: value
+                for key, value in metadata.items()
+                if value != []
+            }
             self.body.append(
-                f'<lit-block-info data="{encoded_metadata}"></lit-block-info>'
+                f'<lit-block-info block-id="{block_id}"></lit-block-info>'
             )
 
             if skip:
@@ -230,3 +316,4 @@ class LiterateNode(nodes.General, nodes.Element):
 def setup(app):
     app.add_node(TangleNode)
     app.add_node(LiterateNode, **LiterateNode.build_translation_handlers(app))
+    app.add_node(HiddenBlockNode, **HiddenBlockNode.build_translation_handlers(app))
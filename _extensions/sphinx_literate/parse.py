@@ -1,17 +1,18 @@
-from typing import List, Dict, Set, Tuple
+from typing import List, Dict, NamedTuple, Set, Tuple
 from dataclasses import dataclass, field
+from functools import lru_cache
 from pathlib import Path
-import random
+import hashlib
 import re
 
-from .registry import CodeBlock, Key, BlockOptions
+from .registry import CodeBlock, Key
 
 from sphinx.errors import ExtensionError
 
 #############################################################
 # Block Title
 
-@dataclass
+@dataclass(frozen=True)
 class ParsedBlockTitle:
     """
     The raw title of a lit block looks like:
@@ -32,115 +33,117 @@ class ParsedBlockTitle:
     lexer: str | None = None
 
     # Possible options are 'APPEND', 'REPLACE', ('INSERT AFTER', "foo", "bar"),
-    # ('TANGLE ROOT', 'REPLACE', "foo"), ...
-    options: BlockOptions = field(default_factory=set)
+    # ('TANGLE ROOT', 'REPLACE', "foo"), ... in the order of the title.
+    options: Tuple[str|Tuple[str], ...] = ()
 
 #############################################################
 
-def parse_option(raw_option: str) -> str|Tuple[str]:
-    # TODO: route config up to here
-    begin_ref = '{{' # config.lit_begin_ref
-    end_ref = '}}' # config.lit_end_ref
+class InsertOption(NamedTuple):
+    """
+    Option 'insert in {{block}} before/after "pattern"'
+    """
+    kind: str  # always 'INSERT'
+    block_name: str
+    placement: str
+    pattern: str
 
+class TangleRootOption(NamedTuple):
+    """
+    Options 'for tangle root "root"' (REPLACE) and 'also for tangle root
+    "root"' (APPEND)
+    """
+    kind: str  # always 'TANGLE ROOT'
+    mode: str
+    tangle_root: str
+
+# TODO: route config up to here
+_OPTION_BEGIN_REF = '{{' # config.lit_begin_ref
+_OPTION_END_REF = '}}' # config.lit_end_ref
+
+_OPTION_PREFIX_RE = re.compile(
+    r"(?P<insert>insert in " + re.escape(_OPTION_BEGIN_REF) + r")" +
+    r"|(?P<for_root>for tangle root)" +
+    r"|(?P<also_for_root>also for tangle root)",
+    re.IGNORECASE,
+)
+
+def parse_option(raw_option: str) -> str|InsertOption|TangleRootOption:
     raw_option = raw_option.strip()
-    if raw_option.lower().startswith("insert in " + begin_ref.lower()):
-        offset = len("insert in " + begin_ref)
-        i = raw_option.find(end_ref, offset)
+    m = _OPTION_PREFIX_RE.match(raw_option)
+    if m is None:
+        return raw_option.upper()
+
+    offset = m.end()
+    if m.lastgroup == 'insert':
+        i = raw_option.find(_OPTION_END_REF, offset)
         if i == -1:
             raise ExtensionError(f"Unable to parse option '{raw_option}' (could not find end of block name)")
         block_name = raw_option[offset:i]
         j = raw_option.find('"', i)
-        placement = raw_option[i+len(end_ref):j].strip().upper()
         if j == -1:
             raise ExtensionError(f"Unable to parse option '{raw_option}' (could not find beginning of line pattern)")
+        placement = raw_option[i+len(_OPTION_END_REF):j].strip().upper()
         if raw_option[-1] != '"':
             raise ExtensionError(f"Unable to parse option '{raw_option}' (should end with '\"')")
         pattern = raw_option[j+1:-1]
-        return ('INSERT', block_name, placement, pattern)
-        return ('INSERT BEFORE', block_name, pattern)
-    if raw_option.lower().startswith("for tangle root"):
-        offset = len("for tangle root")
-        j = raw_option.find('"', offset)
-        if j == -1:
-            raise ExtensionError(f"Unable to parse option '{raw_option}' (could not find beginning of tangle root)")
-        if raw_option[-1] != '"':
-            raise ExtensionError(f"Unable to parse option '{raw_option}' (should end with '\"')")
-        tangle_root = raw_option[j+1:-1]
-        return ('TANGLE ROOT', 'REPLACE', tangle_root)
-    if raw_option.lower().startswith("also for tangle root"):
-        offset = len("also for tangle root")
+        return InsertOption('INSERT', block_name, placement, pattern)
+    else:
         j = raw_option.find('"', offset)
         if j == -1:
             raise ExtensionError(f"Unable to parse option '{raw_option}' (could not find beginning of tangle root)")
         if raw_option[-1] != '"':
             raise ExtensionError(f"Unable to parse option '{raw_option}' (should end with '\"')")
         tangle_root = raw_option[j+1:-1]
-        return ('TANGLE ROOT', 'APPEND', tangle_root)
-    else:
-        return raw_option.upper()
-
-def parse_block_title_options(raw_options: str) -> List[str|Tuple[str]]:
+        mode = 'REPLACE' if m.lastgroup == 'for_root' else 'APPEND'
+        return TangleRootOption('TANGLE ROOT', mode, tangle_root)
+
+# Options are separated by commas, except within double quoted strings, in
+# which a backslash escapes the next character. An unterminated string runs
+# until the end of the options.
+_OPTION_PIECE_RE = re.compile(
+    r'(?P<separator>,)' +
+    r'|(?P<string>"(?:[^"\\]|\\.)*(?:"|\\?\Z))' +
+    r'|(?P<plain>[^,"]+)',
+    re.DOTALL,
+)
+_STRING_ESCAPE_RE = re.compile(r'\\(.?)', re.DOTALL)
+
+def parse_block_title_options(raw_options: str) -> Tuple[str|InsertOption|TangleRootOption, ...]:
     if raw_options is None:
-        return set()
+        return ()
     raw_options = raw_options[1:-1]
 
-    # Parsing automata, possible states:
-    (
-        DEFAULT,
-        IN_STRING,
-        IN_STRING_ESCAPE,
-    ) = range(3)
-    # Possible actions:
-    (
-        ACCUMULATE,
-        NEW_TOKEN,
-        IGNORE,
-    ) = range(3)
-    transitions = {
-        DEFAULT: {
-            '"': (IN_STRING, ACCUMULATE),
-            ',': (DEFAULT, NEW_TOKEN),
-            ...: (DEFAULT, ACCUMULATE),
-        },
-        IN_STRING: {
-            '\\': (IN_STRING_ESCAPE, IGNORE),
-            '"': (DEFAULT, ACCUMULATE),
-            ...: (IN_STRING, ACCUMULATE),
-        },
-        IN_STRING_ESCAPE: {
-            ...: (IN_STRING, ACCUMULATE),
-        },
-    }
-    cursor = 0
-    state = DEFAULT
-    token = ""
     all_tokens = []
-    while cursor < len(raw_options):
-        char = raw_options[cursor]
-        cursor += 1
-        tr = transitions[state]
-        state, action = tr.get(char, tr[...])
-        if action == NEW_TOKEN:
-            all_tokens.append(token)
-            token = ""
-        elif action == ACCUMULATE:
-            token += char
-        elif action == IGNORE:
-            pass
-    all_tokens.append(token)
-
-    return [
+    token = []
+    for m in _OPTION_PIECE_RE.finditer(raw_options):
+        kind = m.lastgroup
+        if kind == 'separator':
+            all_tokens.append(''.join(token))
+            token = []
+        elif kind == 'string':
+            token.append(_STRING_ESCAPE_RE.sub(r'\1', m.group()))
+        else:
+            token.append(m.group())
+    all_tokens.append(''.join(token))
+
+    return tuple(
         parse_option(opt)
         for opt in all_tokens
-    ]
+    )
 
+_TITLE_RE = re.compile(r"^((?P<lexer>[^(,]*),)?(?P<name>[^(,]*)(?P<options>\(.*\))?$")
+
+# Parsed titles are cached by raw title (titles often repeat across tangle
+# roots and translations).
+@lru_cache(maxsize=4096)
 def parse_block_title(raw_title: str) -> ParsedBlockTitle:
     """
     This parse a literate code block title (@see ParsedBlockTitle)
     @param raw_title title as returned by Directive.arguments[0]
-    @return a parsed title object
+    @return a parsed title object, shared among all calls with the same
+            title (hence immutable)
     """
-    m = re.match(r"^((?P<lexer>[^(,]*),)?(?P<name>[^(,]*)(?P<options>\(.*\))?$", raw_title.strip())
+    m = _TITLE_RE.match(raw_title.strip())
 
     if m is None:
         message = (
@@ -175,17 +178,37 @@ class BlockLink:
     """
 
     # Name of the referenced block
-    key: Key = ""
+    key: Key = Key("", "")
 
     # Possible options are 'HIDDEN'
     options: Set[str] = field(default_factory=list)
 
+@dataclass
+class BlockReference:
+    """
+    Reference to a literate block as written in the source, which does not
+    depend on the tangle root yet.
+    """
+
+    # Name of the referenced block
+    name: str = ""
+
+    # Possible options are 'HIDDEN'
+    options: Set[str] = field(default_factory=set)
+
+    def bind(self, tangle_root: str | None) -> BlockLink:
+        return BlockLink(
+            key = CodeBlock.build_key(self.name, tangle_root),
+            options = self.options,
+        )
+
 @dataclass
 class ParsedBlockContent:
     """
     The content of each literate block is parsed and references are replaced
     with unique ids (hashcode) so that they can be recognized after syntax
-    highlight is added.
+    highlight is added. This does not depend on the tangle root, so that a
+    block that targets several roots is parsed only once.
     """
 
     # Content of the block where references are replaced with uids
@@ -193,16 +216,61 @@ class ParsedBlockContent:
 
     # Holds the mapping from the uids and the original references to other
     # literate code blocks.
-    uid_to_block_link: Dict[Uid,BlockLink]
+    uid_to_reference: Dict[Uid,BlockReference]
+
+    # Memoized result of links()
+    _links_by_root: Dict[str|None,Dict[Uid,BlockLink]] = field(default_factory=dict)
+
+    def links(self, tangle_root: str | None) -> Dict[Uid,BlockLink]:
+        """
+        Links to other blocks, resolved in the context of the given root
+        """
+        links = self._links_by_root.get(tangle_root)
+        if links is None:
+            links = self._links_by_root[tangle_root] = {
+                uid: ref.bind(tangle_root)
+                for uid, ref in self.uid_to_reference.items()
+            }
+        return links
+
+#############################################################
+
+def generate_uid(seed: str, index: int) -> Uid:
+    """
+    Uid of the index-th reference of a block. It is derived from a seed that
+    identifies the block (rather than random) so that unchanged documents
+    produce identical doctrees and output from one build to another.
+    """
+    return "_" + hashlib.sha1(f"{seed}:{index}".encode()).hexdigest()[:32]
+
+# Matches any uid returned by generate_uid (in highlighted code for instance)
+UID_PATTERN = re.compile(r"_[0-9a-f]{32}")
 
 #############################################################
 
-def generate_uid() -> Uid:
-    return "_" + "".join([random.choice("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789") for _ in range(32)])
+# Compiled reference scanners, indexed by (begin_ref, end_ref)
+_reference_patterns: Dict[Tuple[str,str],re.Pattern] = {}
+
+def reference_pattern(begin_ref: str, end_ref: str) -> re.Pattern:
+    """
+    Regex matching a reference to a block, delimited by config.lit_begin_ref
+    and config.lit_end_ref. The raw link is captured in group 'link'.
+    """
+    key = (begin_ref, end_ref)
+    pattern = _reference_patterns.get(key)
+    if pattern is None:
+        pattern = _reference_patterns[key] = re.compile(
+            re.escape(begin_ref) + r"(?P<link>.*?)" + re.escape(end_ref),
+            re.DOTALL,
+        )
+    return pattern
 
 #############################################################
 
 def parse_block_link(content: str, tangle_root: str | None) -> BlockLink:
+    return parse_block_reference(content).bind(tangle_root)
+
+def parse_block_reference(content: str) -> BlockReference:
     m = re.match(r"(?P<name>[^(,]*)(?P<options>\(.*\))?", content)
 
     if m is None:
@@ -220,12 +288,12 @@ def parse_block_link(content: str, tangle_root: str | None) -> BlockLink:
             for opt in options[1:-1].split(',')
         }
 
-    return BlockLink(
-        key = CodeBlock.build_key(name, tangle_root),
+    return BlockReference(
+        name = name,
         options = options,
     )
 
-def parse_block_content(content: List[str], tangle_root: str | None, config) -> ParsedBlockContent:
+def parse_block_content(content: List[str], config, uid_seed: str = "", location: Tuple[str,int] | None = None) -> ParsedBlockContent:
     """
     This reads the raw source code and extracts {{references}} to other blocks,
     not to disturb the syntax highlighter.
@@ -233,13 +301,15 @@ def parse_block_content(content: List[str], tangle_root: str | None, config) ->
     @note At this stage we do not check whether block names exist.
 
     @param content original source code with literate references
-    @param tangle_root context of the block
     @param config sphinx config
+    @param uid_seed identifies the block, to derive reference uids from
+    @param location (docname, lineno) of the first line of content, to report
+                    warnings
     @return a parsed block object
     """
     parsed = ParsedBlockContent(
         content = [],
-        uid_to_block_link = {},
+        uid_to_reference = {},
     )
 
     raw_source = '\n'.join(content)
@@ -248,25 +318,33 @@ def parse_block_content(content: List[str], tangle_root: str | None, config) ->
     end_ref = config.lit_end_ref
 
     offset = 0
-    parsed_source = ""
-    while True:
-        begin_offset = raw_source.find(begin_ref, offset)
-        if begin_offset == -1:
-            break
-        end_offset = raw_source.find(end_ref, begin_offset)
-        if end_offset == -1:
-            print(f"Warning: Found a reference openning '{begin_ref}' but reached end of block before finding the reference closing '{end_ref}'")
-            break
-        uid = generate_uid()
-        block_name = raw_source[begin_offset+len(begin_ref):end_offset]
-        parsed.uid_to_block_link[uid] = parse_block_link(block_name, tangle_root)
-        parsed_source += raw_source[offset:begin_offset]
-        parsed_source += uid
-        offset = end_offset + len(end_ref)
-
-    parsed_source += raw_source[offset:]
-
-    parsed.content = parsed_source.split('\n')
+    parsed_source = []
+    for m in reference_pattern(begin_ref, end_ref).finditer(raw_source):
+        uid = generate_uid(uid_seed, len(parsed.uid_to_reference))
+        parsed.uid_to_reference[uid] = parse_block_reference(m.group('link'))
+        parsed_source.append(raw_source[offset:m.start()])
+        parsed_source.append(uid)
+        offset = m.end()
+
+    unterminated_offset = raw_source.find(begin_ref, offset)
+    if unterminated_offset != -1:
+        if location is not None:
+            docname, lineno = location
+            location = (docname, lineno + raw_source.count('\n', 0, unterminated_offset))
+        # Imported here, so that this module can be used without loading all
+        # of Sphinx (see query.py)
+        from sphinx.util import logging
+        logger = logging.getLogger(__name__)
+        logger.warning(
+            f"Found a reference openning '{begin_ref}' but reached end of block before finding the reference closing '{end_ref}'",
+            location=location,
+            type="sphinx_literate",
+            subtype="reference",
+        )
+
+    parsed_source.append(raw_source[offset:])
+
+    parsed.content = ''.join(parsed_source).split('\n')
 
     return parsed
 
@@ -0,0 +1,226 @@
+"""
+Answer questions about literate blocks from a registry snapshot, written in
+the tangle output directory by the tangle builder or tangle_cli, without
+loading Sphinx. Meant for scripts and editor integrations:
+
+    PYTHONPATH=_extensions python -m sphinx_literate.query _build/tangle/registry.snapshot list-roots
+    ... tangle "file: main.cpp" --root "001 - Hello WebGPU"
+    ... where-defined "file: main.cpp"
+    ... who-references "Main content" --root "001 - Hello WebGPU"
+    ... list-blocks --root "001 - Hello WebGPU"
+
+Add --json to get machine readable results.
+"""
+
+from typing import Any, Dict, List
+import argparse
+import json
+import pickle
+import sys
+
+from sphinx.errors import ExtensionError
+
+from .registry import CodeBlock, CodeBlockRegistry, Key
+from .snapshot import load_snapshot
+from .tangle import tangle
+
+#############################################################
+# Queries, each one returns a JSON serializable result
+
+def describe(lit: CodeBlock) -> Dict[str,Any]:
+    return {
+        "name": lit.name,
+        "tangle_root": lit.tangle_root,
+        "relation_to_prev": lit.relation_to_prev,
+        "docname": lit.source_location.docname,
+        "lineno": lit.source_location.lineno,
+    }
+
+def blocks_named(registry: CodeBlockRegistry, name: str) -> List[CodeBlock]:
+    """Head blocks with the given name, in all tangle roots"""
+    return [
+        lit
+        for key, lit in registry.items()
+        if key.name == name
+    ]
+
+def definition_chain(lit: CodeBlock) -> List[CodeBlock]:
+    """
+    Blocks that define the given one, from the first one: the blocks of the
+    chains that it modifies in parent tangle roots, then the ones of its own
+    chain.
+    @param lit first block of a chain
+    """
+    heads = []
+    while lit is not None:
+        heads.append(lit)
+        # The previous block of the first block of a chain is in a parent
+        # tangle root, except for inserted blocks (where it is the modifier)
+        lit = lit.prev if lit.relation_to_prev not in {'NEW', 'INSERTED'} else None
+    blocks = []
+    for lit in reversed(heads):
+        while lit is not None:
+            blocks.append(lit)
+            lit = lit.next
+    return blocks
+
+def ancestor_roots(registry: CodeBlockRegistry, tangle_root: str) -> List[str]:
+    """The given tangle root followed by its parents"""
+    roots = []
+    while tangle_root is not None:
+        roots.append(tangle_root)
+        info = registry.get_tangle_info(tangle_root)
+        tangle_root = info.parent if info is not None else None
+    return roots
+
+def query_list_roots(registry: CodeBlockRegistry, args) -> List[Dict[str,Any]]:
+    roots = []
+    for tangle_root in sorted(registry.all_tangle_roots(), key=str):
+        info = registry.get_tangle_info(tangle_root)
+        roots.append({
+            "tangle_root": tangle_root,
+            "parent": info.parent if info is not None else None,
+        })
+    return roots
+
+def query_list_blocks(registry: CodeBlockRegistry, args) -> List[Dict[str,Any]]:
+    """
+    Blocks of a tangle root, including the ones inherited from its parents,
+    or all blocks if no root is given.
+    """
+    if args.root is None:
+        blocks = registry.blocks()
+    else:
+        blocks = registry.blocks_by_root(args.root)
+    return sorted(
+        (describe(lit) for lit in blocks),
+        key=lambda d: (str(d["tangle_root"]), d["name"]),
+    )
+
+def query_where_defined(registry: CodeBlockRegistry, args) -> List[Dict[str,Any]]:
+    """
+    Where the block and its modifications (append, replace, etc.) are
+    defined, as seen from the given tangle root, or from all the roots that
+    define a block with this name.
+    """
+    if args.root is not None:
+        lit = registry.get_rec(args.name, args.root)
+        return [describe(b) for b in definition_chain(lit)] if lit is not None else []
+    locations = []
+    for lit in blocks_named(registry, args.name):
+        while lit is not None:
+            locations.append(describe(lit))
+            lit = lit.next
+    return locations
+
+def query_who_references(registry: CodeBlockRegistry, args) -> List[Dict[str,Any]]:
+    """
+    Blocks that reference a block, as seen from the given tangle root
+    (including the blocks inherited from its parents), or from all the roots
+    that define a block with this name.
+    """
+    if args.root is None:
+        referencers = []
+        for lit in blocks_named(registry, args.name):
+            for ref in registry.references_to_key(lit.key):
+                referencer = registry.get_by_key(ref)
+                if referencer is not None:
+                    referencers.append(describe(referencer))
+        return referencers
+
+    # References are bound to the tangle root of the referencer, which may be
+    # a parent of the requested root.
+    referencers = []
+    seen = set()
+    for tangle_root in ancestor_roots(registry, args.root):
+        for ref in sorted(registry.references_to_key(CodeBlock.build_key(args.name, tangle_root))):
+            referencer = registry.get_by_key(ref)
+            if referencer is None or id(referencer) in seen:
+                continue
+            # Only keep the referencers that are part of the blocks seen from
+            # the requested root
+            visible = registry.get_rec(referencer.name, args.root)
+            if visible is None or all(b is not referencer for b in definition_chain(visible)):
+                continue
+            seen.add(id(referencer))
+            referencers.append(describe(referencer))
+    return referencers
+
+def query_tangle(registry: CodeBlockRegistry, args, config) -> List[str]:
+    tangled_content, _ = tangle(args.name, args.root, registry, config)
+    return tangled_content
+
+#############################################################
+# Main
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m sphinx_literate.query",
+        description="Query literate blocks from a registry snapshot, without building the documentation.",
+    )
+    parser.add_argument("snapshot", help="registry snapshot, found in the tangle output directory")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("list-roots", help="list tangle roots and their parent")
+
+    sub = subparsers.add_parser("list-blocks", help="list the blocks of a tangle root (or all blocks)")
+    sub.add_argument("--root", help="tangle root, inherited blocks are included")
+
+    for command, help in [
+        ("tangle", "print the tangled content of a block"),
+        ("where-defined", "print where a block and its modifications are defined"),
+        ("who-references", "print the blocks that reference a block"),
+    ]:
+        sub = subparsers.add_parser(command, help=help)
+        sub.add_argument("name", help="name of the block, e.g. 'file: main.cpp'")
+        sub.add_argument("--root", help="tangle root (for 'tangle', default: no root)")
+
+    args = parser.parse_args()
+
+    try:
+        snapshot = load_snapshot(args.snapshot)
+        registry = snapshot.registry
+        if args.command == "tangle":
+            result = query_tangle(registry, args, snapshot.config)
+        else:
+            query = {
+                "list-roots": query_list_roots,
+                "list-blocks": query_list_blocks,
+                "where-defined": query_where_defined,
+                "who-references": query_who_references,
+            }[args.command]
+            result = query(registry, args)
+    except ExtensionError as err:
+        sys.stderr.write(f"Error: {err.message}\n")
+        sys.exit(1)
+    except OSError as err:
+        sys.stderr.write(f"Error: cannot read the registry snapshot: {err}\n")
+        sys.exit(1)
+    except (pickle.UnpicklingError, EOFError) as err:
+        sys.stderr.write(f"Error: the registry snapshot {args.snapshot} is corrupted ({err}), tangle the documentation again to update it.\n")
+        sys.exit(1)
+
+    if args.json:
+        json.dump(result, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    elif args.command == "tangle":
+        # Same content as the tangled file (see builder.write_tangled_file)
+        sys.stdout.write("\n".join(result))
+    else:
+        for entry in result:
+            sys.stdout.write(format_entry(entry) + "\n")
+
+def format_entry(entry: Dict[str,Any]) -> str:
+    if "name" not in entry:
+        # Tangle root
+        parent = f" (parent: {entry['parent']})" if entry["parent"] is not None else ""
+        return f"{entry['tangle_root']}{parent}"
+    relation = f" [{entry['relation_to_prev']}]" if entry["relation_to_prev"] != 'NEW' else ""
+    return (
+        f"{entry['name']} ({entry['tangle_root']}){relation}"
+        f" in document '{entry['docname']}', line {entry['lineno']}"
+    )
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,37 @@
 from __future__ import annotations
-from typing import Any, Dict, Set, Tuple
-from dataclasses import dataclass, field
+from typing import Any, Dict, NamedTuple, Set, Tuple
+from dataclasses import dataclass, field, fields
 from collections import defaultdict
 from pathlib import Path
-import random
+import sys
 
 from sphinx.errors import ExtensionError
 
+from .utils import relative_uri
+from .stats import RegistryStats
+
 #############################################################
 
 BlockOptions = Set[str|Tuple[str]]
 
-Key = str
+class Key(NamedTuple):
+    """
+    Identifies a chain of blocks within the registry. Blocks that do not
+    belong to any tangle root use the empty string as tangle root.
+    """
+    tangle_root: str
+    name: str
+
+    def __str__(self):
+        return f"{self.tangle_root}##{self.name}"
 
 #############################################################
 
-@dataclass
+@dataclass(slots=True)
 class SourceLocation:
     """
-    Represents a location in the documentation's source
+    Represents a location in the documentation's source. Blocks defined by
+    the same directive share the same instance.
     """
 
     # Name of the document
@@ -32,7 +45,7 @@ class SourceLocation:
 
 #############################################################
 
-@dataclass
+@dataclass(slots=True)
 class InsertLocation:
     # Either 'BEFORE' or 'AFTER'
     placement: str
@@ -43,11 +56,12 @@ class InsertLocation:
 #############################################################
 # Codeblock
 
-@dataclass
+@dataclass(slots=True)
 class CodeBlock:
     """
     Data store about a code block parsed from a {lit} directive, to be
-    assembled when tangling.
+    assembled when tangling. This is kept compact (slots, no docutils node)
+    because all blocks are pickled with the build environment.
     TODO This class should be split in 2 parts:
      1. What directly comes from a given source block
      2. What relates to CodeBlock being a nodes in the block graph
@@ -62,11 +76,11 @@ class CodeBlock:
     # Tangle root as defined by lit-setup at the time the block was created
     tangle_root: str | None = None
 
-    # A list of lines
-    content: List[str] = field(default_factory=list)
+    # Lines of the block (including references, as in the source)
+    content: Tuple[str, ...] = ()
 
-    # Target anchor for referencing this code block in internal links
-    target: Any = None
+    # Id of the target anchor for referencing this code block in internal links
+    target_id: str = ""
 
     lexer: str | None = None
 
@@ -110,9 +124,13 @@ class CodeBlock:
 
     @classmethod
     def build_key(cls, name: str, tangle_root: str | None = None) -> Key:
+        """
+        Build a key meant to be stored, with interned strings so that all
+        keys (and blocks) share the same tangle root and name strings.
+        """
         if tangle_root is None:
             tangle_root = ""
-        return tangle_root + "##" + name
+        return Key(sys.intern(tangle_root), sys.intern(name))
 
     @property
     def key(self) -> Key:
@@ -120,13 +138,28 @@ class CodeBlock:
 
     def add_block(self, lit: CodeBlock) -> None:
         """
-        Add a block at the end of the chained list
+        Add a block (and the blocks that follow it) to the chained list, after
+        the blocks of the same document and of the documents read before it.
+        When documents are read in order, this is the end of the list, and when
+        a document is read again by an incremental build, this keeps the order
+        of a full build.
         """
+        docname = lit.source_location.docname
         last = self
-        while last.next is not None:
+        while last.next is not None and last.next.source_location.docname <= docname:
             last = last.next
+
+        # Blocks from documents read after this one
+        following = last.next
+
         last.next = lit
         lit.prev = last
+        if following is not None:
+            tail = lit
+            while tail.next is not None:
+                tail = tail.next
+            tail.next = following
+            following.prev = tail
 
         # Update child index for 'lit' and its children
         child_index = last.child_index + 1
@@ -146,6 +179,12 @@ class CodeBlock:
                            different if referencing inserted blocks that are
                            redefined in children.
         """
+        stats = registry.stats if registry is not None else None
+        if stats is None:
+            return self._all_content(registry, tangle_root, None)
+        return stats.count_all_content(self, tangle_root, self._all_content(registry, tangle_root, stats))
+
+    def _all_content(self, registry: CodeBlockRegistry, tangle_root: str | None, stats: RegistryStats | None):
         debug = []  # collect all yielded values for error message
         debug.append(f"%% Getting content of block {self.format()} from {self.source_location.format()}")
         if tangle_root is None:
@@ -174,6 +213,8 @@ class CodeBlock:
             lit = lit.next
 
         def _maybeInsertAux(l, placement):
+            if stats is not None:
+                stats.insert_pattern_checks += len(insert_nodes[placement])
             matched = []
             for pattern, nodes in insert_nodes[placement].items():
                 if pattern in l:
@@ -281,8 +322,8 @@ class CodeBlock:
                        get_relative_uri method)
         """
         return (
-            builder.get_relative_uri(fromdocname, self.source_location.docname)
-            + '#' + self.target['refid']
+            relative_uri(builder, fromdocname, self.source_location.docname)
+            + '#' + self.target_id
         )
 
 #############################################################
@@ -309,7 +350,7 @@ class TangleHierarchyEntry:
 
 #############################################################
 
-@dataclass
+@dataclass(slots=True)
 class MissingCodeBlock:
     """
     We allow missing blocks to enable parallel compilation. Missing
@@ -355,9 +396,88 @@ class CodeBlockRegistry:
         # parallel units.
         self._missing: List[MissingCodeBlock] = []
 
+        # References (referencer, referencee) made by the blocks of each
+        # document, to resolve their links and purge them with the document
+        self._references_by_docname: Dict[str,Set[Tuple[Key,Key]]] = defaultdict(set)
+
+        # Statistics about lookups and tangling, None unless enabled by
+        # lit_registry_stats (see stats.py). They are not serialized.
+        self.stats: RegistryStats | None = None
+
+        # Data derived by finalize() once all documents have been read, it is
+        # invalidated by any change to the registry.
+        self._finalized: bool = False
+        self._blocks_by_uid: Dict[str,CodeBlock] = {}
+        self._resolved_references: Dict[Key,List[CodeBlock]] = {}
+        self._resolved_links_by_docname: Dict[str,Dict[Key,CodeBlock|None]] = {}
+
+    # Members of CodeBlock that point to other blocks
+    _LINK_FIELDS = {'next', 'prev', 'inserted_block'}
+
+    def __getstate__(self) -> Dict[str,Any]:
+        """
+        Blocks are serialized as a flat list in which links to other blocks
+        are replaced by indices in this list, so that pickling does not
+        recurse along chains of blocks. Derived data is not serialized.
+        """
+        blocks: List[CodeBlock] = []
+        index: Dict[int,int] = {}
+        to_visit = list(self._blocks.values())
+        while to_visit:
+            lit = to_visit.pop()
+            if lit is None or id(lit) in index:
+                continue
+            index[id(lit)] = len(blocks)
+            blocks.append(lit)
+            to_visit.extend([lit.next, lit.prev, lit.inserted_block])
+
+        def flatten(lit):
+            values = []
+            for f in fields(CodeBlock):
+                value = getattr(lit, f.name)
+                if f.name in self._LINK_FIELDS:
+                    value = -1 if value is None else index[id(value)]
+                values.append(value)
+            return tuple(values)
+
+        return {
+            'blocks': [flatten(lit) for lit in blocks],
+            'heads': {
+                key: index[id(lit)]
+                for key, lit in self._blocks.items()
+            },
+            'references': dict(self._references),
+            'hierarchy': self._hierarchy,
+            'missing': self._missing,
+            'references_by_docname': dict(self._references_by_docname),
+        }
+
+    def __setstate__(self, state: Dict[str,Any]) -> None:
+        self.__init__()
+
+        blocks = [CodeBlock(*values) for values in state['blocks']]
+        link_fields = [f.name for f in fields(CodeBlock) if f.name in self._LINK_FIELDS]
+        for lit in blocks:
+            for name in link_fields:
+                i = getattr(lit, name)
+                setattr(lit, name, None if i == -1 else blocks[i])
+
+        self._blocks = {
+            key: blocks[i]
+            for key, i in state['heads'].items()
+        }
+        self._references.update(state['references'])
+        self._hierarchy = state['hierarchy']
+        self._missing = state['missing']
+        self._references_by_docname.update(state['references_by_docname'])
+
     @classmethod
-    def create_uid(cls):
-        return ''.join([random.choice('123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ') for _ in range(16)])
+    def create_uid(cls, lit: CodeBlock) -> str:
+        """
+        Target ids are unique within a document, so they identify a block
+        together with the docname (and do not change from a build to another).
+        """
+        return f"{lit.source_location.docname}#{lit.target_id}"
 
     def register_codeblock(self, lit: CodeBlock, options: BlockOptions = set()) -> None:
         """
@@ -380,10 +500,16 @@ class CodeBlockRegistry:
         @param options the options
         """
         assert(lit.uid is None)
-        lit.uid = self.create_uid()
+        lit.uid = self.create_uid(lit)
+        self._finalized = False
+
+        # Share name strings among all blocks and keys
+        lit.name = sys.intern(lit.name)
+        if lit.tangle_root is not None:
+            lit.tangle_root = sys.intern(lit.tangle_root)
 
         opt_dict = {
-            (x[0] if type(x) == tuple else x): x
+            (x[0] if isinstance(x, tuple) else x): x
             for x in options
         }
         lit.hidden = 'HIDDEN' in options
@@ -404,7 +530,7 @@ class CodeBlockRegistry:
                 name = block_name,
                 tangle_root = lit.tangle_root,
                 source_location = lit.source_location,
-                target = lit.target,
+                target_id = lit.target_id,
                 lexer = lit.lexer,
             )
             modifier.inserted_location = InsertLocation(placement, pattern)
@@ -424,13 +550,6 @@ class CodeBlockRegistry:
         the same key, an error is raised.
         @param lit block to add
         """
-        if "##" in lit.name:
-            message = (
-                f"The sequence '##' is not allowed in a block name, " +
-                f"it is reserved to internal mechanisms.\n"
-            )
-            raise ExtensionError(message, modname="sphinx_literate")
-
         key = lit.key
         existing = self.get_by_key(key)
 
@@ -471,11 +590,15 @@ class CodeBlockRegistry:
         else:
             existing.add_block(lit)
 
-    def add_reference(self, referencer: Key, referencee: Key) -> None:
+    def add_reference(self, referencer: Key, referencee: Key, docname: str | None = None) -> None:
         """
         Signal that `referencer` contains a reference to `referencee`
+        @param docname document in which the reference is made, if known
         """
         self._references[referencee].add(referencer)
+        if docname is not None:
+            self._references_by_docname[docname].add((referencer, referencee))
+        self._finalized = False
 
     def merge(self, other: CodeBlockRegistry) -> None:
         """
@@ -498,11 +621,16 @@ class CodeBlockRegistry:
         # Merge cross-references
         for key, refs in other._references.items():
             self._references[key].update(refs)
+        for docname, refs in other._references_by_docname.items():
+            self._references_by_docname[docname].update(refs)
+
+        self._finalized = False
 
     def try_fixing_all_missing(self):
+        self._finalized = False
         new_missing_list = []
         for missing in self._missing[:]:
-            missing_tangle_root, missing_name = missing.key.split("##")
+            missing_tangle_root, missing_name = missing.key
 
             # Look for the missing lit name in the parent tangle
             entry = self._hierarchy.get(missing_tangle_root)
@@ -523,12 +651,105 @@ class CodeBlockRegistry:
         self._missing = new_missing_list
 
     def remove_codeblocks_by_docname(self, docname: str) -> None:
-        # TODO: when supporting cross-document REPLACE, be careful here
-        self._blocks = {
-            key: lit
-            for key, lit in self._blocks.items()
-            if lit.source_location.docname != docname
+        self.remove_codeblocks_by_docnames({docname})
+
+    def remove_codeblocks_by_docnames(self, docnames: Set[str]) -> None:
+        """
+        Remove the blocks defined in the given documents, including the ones
+        that modify blocks of other documents, as well as the references and
+        the tangle parents that these documents define.
+        Blocks of other documents whose previous block is removed become
+        missing. For blocks of another tangle root, this is resolved again by
+        finalize(), but the first block of a chain must be registered again
+        before the blocks that modify it, so their documents must be read
+        again as well (see docnames_to_read_again()).
+        """
+        self._finalized = False
+
+        def is_removed(lit):
+            return lit is not None and lit.source_location.docname in docnames
+
+        # Tangle parents
+        removed_roots = {
+            root
+            for root, h in self._hierarchy.items()
+            if h.source_location.docname in docnames
         }
+        for root in removed_roots:
+            del self._hierarchy[root]
+
+        # Blocks
+        missing = [
+            m for m in self._missing
+            if not is_removed(self.get_by_key(m.key))
+        ]
+        blocks = {}
+        for key, head in self._blocks.items():
+            chain = []
+            lit = head
+            while lit is not None:
+                if not is_removed(lit):
+                    chain.append(lit)
+                lit = lit.next
+            if not chain:
+                continue
+
+            for i, lit in enumerate(chain):
+                lit.next = chain[i + 1] if i + 1 < len(chain) else None
+                if i > 0:
+                    lit.prev = chain[i - 1]
+                    lit.child_index = chain[i - 1].child_index + 1
+
+            first = chain[0]
+            if first is not head:
+                first.child_index = 0
+            # The previous block is either removed, in the same chain, or the
+            # block of another tangle root that first was attached to
+            if (
+                first is not head or is_removed(first.prev)
+                or (first.prev is not None and first.tangle_root in removed_roots and first.relation_to_prev != 'INSERTED')
+            ):
+                first.prev = None
+                if first.relation_to_prev != 'NEW':
+                    missing.append(MissingCodeBlock(first.key, first.relation_to_prev))
+            blocks[key] = first
+        self._blocks = blocks
+        self._missing = missing
+
+        # References
+        removed_references = set()
+        for docname in docnames:
+            removed_references.update(self._references_by_docname.pop(docname, ()))
+        if removed_references:
+            remaining_references = set().union(*self._references_by_docname.values())
+            for referencer, referencee in removed_references - remaining_references:
+                self._references[referencee].discard(referencer)
+
+    def docnames_to_read_again(self, docnames: Set[str]) -> Set[str]:
+        """
+        Documents that must be read again when the given ones change, so that
+        the chains of blocks are registered again in the same order as in a
+        full build: when the first block of a chain is removed, the blocks
+        that other documents add to the chain must be registered again after
+        it (see remove_codeblocks_by_docnames()).
+        @return the given docnames and the ones of all blocks chained to a
+                block that they define first
+        """
+        result = set(docnames)
+        heads = list(self._blocks.values())
+        while True:
+            new_docnames = set()
+            for head in heads:
+                if head.source_location.docname not in result:
+                    continue
+                lit = head.next
+                while lit is not None:
+                    if lit.source_location.docname not in result:
+                        new_docnames.add(lit.source_location.docname)
+                    lit = lit.next
+            if not new_docnames:
+                return result
+            result.update(new_docnames)
 
     def set_tangle_parent(self, tangle_root: str, parent: str, source_location: SourceLocation = SourceLocation(), fetch_files: List[Path] = [], debug = False) -> None:
         """
@@ -539,6 +760,7 @@ class CodeBlockRegistry:
         @param docname Name of the document that sets this parenting
         @param lineno Line where the lit-config that sets this is defined
         """
+        self._finalized = False
         existing = self._hierarchy.get(tangle_root)
         if existing is not None:
             if existing.parent != parent:
@@ -568,7 +790,7 @@ class CodeBlockRegistry:
             # Now that 'tangle_root' has a parent, blocks that were missing for
             # this tangle may be resolved
             def isStillUnresolved(missing):
-                missing_tangle_root, missing_name = missing.key.split("##")
+                missing_tangle_root, missing_name = missing.key
                 if missing_tangle_root == tangle_root:
                     child_lit = self.get_by_key(missing.key)
                     if child_lit is not None:
@@ -589,17 +811,28 @@ class CodeBlockRegistry:
         If a tangle root is given, return only blocks for this tangle root,
         including the inherited ones
         """
-        block_names = set()
-        for b in self._blocks.values():
-            if self.get_rec(b.name, tangle_root) is not None:
-                block_names.add(b.name)
+        # Names found by get_rec(name, tangle_root) are the ones of blocks
+        # defined in tangle_root or one of its ancestors.
+        roots = set()
+        tr = tangle_root
+        if tr is None:
+            roots.add("")
+        while tr is not None:
+            roots.add(tr)
+            tr = self._parent_tangle_root(tr)
+        block_names = {
+            key.name
+            for key in self._blocks
+            if key.tangle_root in roots
+        }
         return [
             self.get_rec(name, tangle_root)
             for name in block_names
         ]
 
     def get(self, name: str, tangle_root: str | None = None) -> CodeBlock:
-        return self.get_by_key(CodeBlock.build_key(name, tangle_root))
+        # Transient key, no need to intern it
+        return self._blocks.get(Key("" if tangle_root is None else tangle_root, name))
 
     def get_rec(self, name: str, tangle_root: str | None, override_tangle_root: str | None = None) -> CodeBlock:
         """
@@ -613,8 +846,10 @@ class CodeBlockRegistry:
         # first 'NEW' (beyond chich blocks with the same names are not
         # overrides, they are unrelated).
         found = None
+        walk_length = 0
         tr = override_tangle_root
         while tr is not None and tr != tangle_root:
+            walk_length += 1
             lit = self.get(name, tr)
             if lit is not None:
                 if lit.relation_to_prev == 'NEW':
@@ -623,29 +858,35 @@ class CodeBlockRegistry:
                     found = lit
             tr = self._parent_tangle_root(tr)
 
-        if found is not None:
-            return found
-
-        if tangle_root is None:
-            return self.get(name)
+        if found is None:
+            if tangle_root is None:
+                walk_length += 1
+                found = self.get(name)
+            else:
+                # In upstream tangle tree, return the first match
+                tr = tangle_root
+                while tr is not None and found is None:
+                    walk_length += 1
+                    found = self.get(name, tr)
+                    tr = self._parent_tangle_root(tr)
 
-        # In upstream tangle tree, return the first match
-        tr = tangle_root
-        while tr is not None:
-            found = self.get(name, tr)
-            if found is not None:
-                return found
-            tr = self._parent_tangle_root(tr)
-        return None
+        if self.stats is not None:
+            self.stats.record_get_rec(override_tangle_root or tangle_root, walk_length)
+        return found
 
     def get_by_key(self, key: Key) -> CodeBlock:
         return self._blocks.get(key)
 
     def get_rec_by_key(self, key: Key, override_tangle_root: str | None = None) -> CodeBlock:
-        tangle_root, name = key.split("##")
+        tangle_root, name = key
         return self.get_rec(name, tangle_root, override_tangle_root)
 
     def get_by_uid(self, uid: str) -> CodeBlock | None:
+        if self.stats is not None:
+            self.stats.uid_lookups += 1
+            self.stats.uid_lookup_scans += not self._finalized
+        if self._finalized:
+            return self._blocks_by_uid.get(uid)
         for b in self._blocks.values():
             bb = b
             while bb is not None:
@@ -662,6 +903,62 @@ class CodeBlockRegistry:
     def references_to_key(self, key: Key) -> List[Key]:
         return list(self._references[key])
 
+    def finalize(self) -> None:
+        """
+        Resolve missing blocks, check integrity and precompute the reverse
+        reference graph and the link targets of each document, so that
+        resolving the literate nodes of a page only requires dictionary
+        lookups. Does nothing if the registry did not change since the last
+        call.
+        """
+        if self._finalized:
+            return
+
+        self.try_fixing_all_missing()
+        self.check_integrity()
+
+        self._blocks_by_uid = {}
+        for b in self._blocks.values():
+            bb = b
+            while bb is not None:
+                self._blocks_by_uid[bb.uid] = bb
+                bb = bb.next
+
+        self._resolved_references = {
+            key: [
+                self.get_by_key(k)
+                for k in sorted(refs)
+            ]
+            for key, refs in self._references.items()
+        }
+
+        self._resolved_links_by_docname = {
+            docname: {
+                referencee: self.get_rec_by_key(referencee)
+                for _, referencee in refs
+            }
+            for docname, refs in self._references_by_docname.items()
+        }
+
+        self._finalized = True
+
+    def resolved_references(self, key: Key) -> List[CodeBlock]:
+        """
+        List the blocks that reference the given key.
+        Only valid after finalize()
+        """
+        assert(self._finalized)
+        return self._resolved_references.get(key, [])
+
+    def resolved_links(self, docname: str) -> Dict[Key,CodeBlock|None]:
+        """
+        Map the keys referenced from the given document to the blocks they
+        resolve to (None for invalid references).
+        Only valid after finalize()
+        """
+        assert(self._finalized)
+        return self._resolved_links_by_docname.get(docname, {})
+
     def all_tangle_roots(self) -> List[str|None]:
         ret = set()
         ret.update({
@@ -744,7 +1041,7 @@ class CodeBlockRegistry:
 
             # Sanity checks
             assert(lit is not None)
-            missing_root, missing_name = missing.key.split("##", 1)
+            missing_root, missing_name = missing.key
             missing_root_parent = self._parent_tangle_root(missing_root)
             if missing_root_parent is not None:
                 #assert(self.get_rec(missing_name, missing_root_parent) is None)
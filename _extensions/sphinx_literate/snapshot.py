@@ -0,0 +1,81 @@
+"""
+Snapshot of the registry, written next to the tangled files, so that tools
+can query the literate blocks without building the documentation again
+(see query.py). Loading a snapshot does not load Sphinx.
+"""
+
+from __future__ import annotations
+from dataclasses import fields
+from typing import NamedTuple
+from types import SimpleNamespace
+import pickle
+
+from sphinx.errors import ExtensionError
+
+from .registry import CodeBlock, CodeBlockRegistry
+
+#############################################################
+
+SNAPSHOT_FILENAME = "registry.snapshot"
+
+# Increment when the content of the snapshot changes. The layout of the
+# pickled blocks is checked separately.
+SNAPSHOT_VERSION = 2
+
+class Snapshot(NamedTuple):
+    registry: CodeBlockRegistry
+
+    # Stand-in for the Sphinx config, with the values used by tangle()
+    config: SimpleNamespace
+
+def save_snapshot(registry: CodeBlockRegistry, config, filename: str) -> None:
+    """
+    @param config sphinx app config, or any object with lit_begin_ref and
+                  lit_end_ref attributes
+    """
+    header = {
+        "version": SNAPSHOT_VERSION,
+        "block_fields": [f.name for f in fields(CodeBlock)],
+        "lit_begin_ref": config.lit_begin_ref,
+        "lit_end_ref": config.lit_end_ref,
+    }
+    # The header is pickled separately, to be checked before unpickling
+    # blocks of a possibly different layout.
+    with open(filename, "wb") as f:
+        pickle.dump(header, f, protocol=pickle.HIGHEST_PROTOCOL)
+        pickle.dump(registry, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+def load_snapshot(filename: str) -> Snapshot:
+    """
+    @raise OSError if the file cannot be read
+    @raise pickle.UnpicklingError if it is not a snapshot
+    @raise ExtensionError if it was written by another version
+    """
+    with open(filename, "rb") as f:
+        header = _load(f)
+        if not isinstance(header, dict):
+            raise pickle.UnpicklingError("invalid snapshot header")
+        block_fields = [field.name for field in fields(CodeBlock)]
+        if header.get("version") != SNAPSHOT_VERSION or header.get("block_fields") != block_fields:
+            message = (
+                f"The registry snapshot {filename} was written by another version " +
+                "of sphinx_literate, tangle the documentation again to update it."
+            )
+            raise ExtensionError(message, modname="sphinx_literate")
+        registry = _load(f)
+    return Snapshot(
+        registry = registry,
+        config = SimpleNamespace(
+            lit_begin_ref = header["lit_begin_ref"],
+            lit_end_ref = header["lit_end_ref"],
+        ),
+    )
+
+def _load(f):
+    try:
+        return pickle.load(f)
+    except (pickle.UnpicklingError, EOFError):
+        raise
+    except Exception as err:
+        # Unpickling arbitrary data fails in many ways
+        raise pickle.UnpicklingError(str(err)) from err
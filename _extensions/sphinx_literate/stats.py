@@ -0,0 +1,132 @@
+"""
+Counters about the work done by the registry and the tangler, to tell which
+tangle roots and blocks dominate the cost of tangling.
+
+Statistics are only collected when lit_registry_stats is True, otherwise the
+registry's `stats` member is None and instrumented code paths skip them.
+They are shown by the {lit-registry} directive (with its :stats: option) and
+written by the tangle builder in registry-stats.json.
+NB: What happens in parallel read processes is not accounted for.
+"""
+
+from __future__ import annotations
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterator, List
+
+#############################################################
+
+class RegistryStats:
+    def __init__(self) -> None:
+        # Calls to CodeBlockRegistry.get_rec, and histogram of the number of
+        # tangle roots they walked through
+        self.get_rec_calls: int = 0
+        self.get_rec_walk_lengths: Counter = Counter()
+
+        # Calls to CodeBlock.all_content and lines they yielded (including
+        # the lines of nested calls, for parents and inserted blocks)
+        self.all_content_calls: int = 0
+        self.all_content_lines: int = 0
+
+        # Number of times a line was tested against an 'insert' pattern
+        self.insert_pattern_checks: int = 0
+
+        # Calls to CodeBlockRegistry.get_by_uid, and how many of them had to
+        # scan all blocks because the registry was not finalized
+        self.uid_lookups: int = 0
+        self.uid_lookup_scans: int = 0
+
+        # Histogram of the recursion depth of the tangler, per tangle root
+        self.tangle_depths: Dict[str,Counter] = defaultdict(Counter)
+
+        # Same counters, broken down by tangle root and by block
+        self.roots: Dict[str,Counter] = defaultdict(Counter)
+        self.blocks: Dict[str,Counter] = defaultdict(Counter)
+
+    # Recording
+
+    def record_get_rec(self, tangle_root: str | None, walk_length: int) -> None:
+        self.get_rec_calls += 1
+        self.get_rec_walk_lengths[walk_length] += 1
+        self.roots[str(tangle_root)]['get_rec_calls'] += 1
+
+    def count_all_content(self, lit, tangle_root: str | None, lines: Iterator[str]) -> Iterator[str]:
+        """Forward the lines yielded by lit.all_content(...) while counting them"""
+        self.all_content_calls += 1
+        root_counter = self.roots[str(tangle_root if tangle_root is not None else lit.tangle_root)]
+        block_counter = self.blocks[str(lit.key)]
+        root_counter['all_content_calls'] += 1
+        block_counter['all_content_calls'] += 1
+        count = 0
+        try:
+            for line in lines:
+                count += 1
+                yield line
+        finally:
+            self.all_content_lines += count
+            root_counter['all_content_lines'] += count
+            block_counter['all_content_lines'] += count
+
+    def record_tangle_depth(self, tangle_root: str | None, depth: int) -> None:
+        self.tangle_depths[str(tangle_root)][depth] += 1
+
+    # Reporting
+
+    def to_dict(self) -> Dict[str,Any]:
+        def histogram(counter):
+            return {str(k): v for k, v in sorted(counter.items())}
+        return {
+            "get_rec_calls": self.get_rec_calls,
+            "get_rec_walk_lengths": histogram(self.get_rec_walk_lengths),
+            "all_content_calls": self.all_content_calls,
+            "all_content_lines": self.all_content_lines,
+            "insert_pattern_checks": self.insert_pattern_checks,
+            "uid_lookups": self.uid_lookups,
+            "uid_lookup_scans": self.uid_lookup_scans,
+            "tangle_depths": {
+                root: {
+                    "max": max(depths),
+                    "histogram": histogram(depths),
+                }
+                for root, depths in self.tangle_depths.items()
+            },
+            "roots": {root: dict(counter) for root, counter in self.roots.items()},
+            "blocks": {key: dict(counter) for key, counter in self.blocks.items()},
+        }
+
+    def pretty_dump(self, top: int = 10) -> List[str]:
+        """
+        Display the counters and the roots and blocks that yield the most lines.
+        Used by {lit-registry} directive.
+        """
+        def by_lines(items):
+            return sorted(items, key=lambda kv: -kv[1]['all_content_lines'])[:top]
+
+        ret = []
+        ret += ["== Registry statistics =="]
+        ret += [f"get_rec calls: {self.get_rec_calls}"]
+        ret += [
+            f"   | {length} roots walked: {count}"
+            for length, count in sorted(self.get_rec_walk_lengths.items())
+        ]
+        ret += [f"all_content calls: {self.all_content_calls}"]
+        ret += [f"all_content lines: {self.all_content_lines}"]
+        ret += [f"Insert pattern checks: {self.insert_pattern_checks}"]
+        ret += [f"uid lookups: {self.uid_lookups} ({self.uid_lookup_scans} full scans)"]
+        ret += [""]
+        ret += [f"Top {top} tangle roots (by lines yielded):"]
+        for root, counter in by_lines(self.roots.items()):
+            depths = self.tangle_depths.get(root)
+            ret += [
+                f" - {root}: {counter['all_content_lines']} lines, "
+                + f"{counter['all_content_calls']} all_content calls, "
+                + f"{counter['get_rec_calls']} get_rec calls"
+                + (f", max tangle depth {max(depths)}" if depths else "")
+            ]
+        ret += [""]
+        ret += [f"Top {top} blocks (by lines yielded):"]
+        for key, counter in by_lines(self.blocks.items()):
+            ret += [
+                f" - {key}: {counter['all_content_lines']} lines, "
+                + f"{counter['all_content_calls']} all_content calls"
+            ]
+        return ret
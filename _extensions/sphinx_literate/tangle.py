@@ -1,7 +1,7 @@
 from typing import List
 
 from .registry import CodeBlock, CodeBlockRegistry
-from .parse import parse_block_link
+from .parse import parse_block_link, reference_pattern
 
 from sphinx.errors import ExtensionError
 
@@ -21,9 +21,12 @@ def _tangle_rec(
     begin_ref: str, # config
     end_ref: str, # config
     tangled_content, # return list
-    prefix = "" # for recursive use only
+    prefix = "", # for recursive use only
+    depth = 0 # for recursive use only
 ) -> None:
     assert(lit is not None)
+    if registry.stats is not None:
+        registry.stats.record_tangle_depth(override_tangle_root or lit.tangle_root, depth)
     tangle_info = _get_tangle_info(registry, lit, override_tangle_root)
     comment_prefix = {
         "c++": "//",
@@ -37,16 +40,14 @@ def _tangle_rec(
         print(f"######## {lit.format()} from {lit.source_location.format()}")
     if tangle_info is not None and tangle_info.debug:
         tangled_content.append(prefix + f"{comment_prefix} {{Begin block {lit.format()}}}")
+    ref_pattern = reference_pattern(begin_ref, end_ref)
     for line in lit.all_content(registry, override_tangle_root):
-        # TODO: use parse.parse_block_content here?
         subprefix = None
         link = None
-        begin_offset = line.find(begin_ref)
-        if begin_offset != -1:
-            end_offset = line.find(end_ref, begin_offset)
-            if end_offset != -1:
-                subprefix = line[:begin_offset]
-                link = line[begin_offset+len(begin_ref):end_offset]
+        m = ref_pattern.search(line) if begin_ref in line else None
+        if m is not None:
+            subprefix = line[:m.start()]
+            link = m.group('link')
         if link is not None:
             parsed_link = parse_block_link(link, lit.tangle_root)
             sublit = registry.get_rec_by_key(parsed_link.key, override_tangle_root=override_tangle_root)
@@ -64,7 +65,8 @@ def _tangle_rec(
                 begin_ref,
                 end_ref,
                 tangled_content,
-                prefix=prefix + subprefix
+                prefix=prefix + subprefix,
+                depth=depth + 1,
             )
         else:
             tangled_content.append(prefix + line)
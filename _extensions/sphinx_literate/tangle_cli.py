@@ -0,0 +1,333 @@
+"""
+Tangle a MyST documentation without building it with Sphinx. Only the
+{lit} and {lit-setup} fences of the Markdown sources are read, with a
+lightweight fence parser, and the output is the same tree (and
+metadata.json) as the one of the 'tangle' builder:
+
+    PYTHONPATH=_extensions python -m sphinx_literate.tangle_cli . _build/tangle
+
+With --watch, the tree is kept up to date while sources are edited (see
+watch.py).
+
+The configuration (lit_begin_ref, lit_end_ref, exclude_patterns and the
+translation extension's rewriting rules) is read from conf.py. As with the
+builder, all source documents are read, whether they are reachable from the
+root toctree or not.
+"""
+
+from typing import Dict, Iterator, List, NamedTuple, Tuple
+from types import SimpleNamespace
+from fnmatch import fnmatch
+from os.path import join, relpath, abspath
+import argparse
+import os
+import re
+import sys
+import time
+
+from sphinx.errors import ExtensionError
+
+from .builder import write_tangled_tree
+from .directives import get_tangle_roots_from_parsed_title
+from .parse import parse_block_content, parse_block_title, parse_fetched_files
+from .registry import CodeBlock, CodeBlockRegistry, SourceLocation
+
+#############################################################
+# Configuration
+
+# Default values of the config values read by this tool
+DEFAULT_CONFIG = {
+    "lit_begin_ref": "{{",
+    "lit_end_ref": "}}",
+    "exclude_patterns": [],
+    "extensions": [],
+    "translation_rewriting_rules": None,
+}
+
+# Always excluded by Sphinx
+EXCLUDE_PATHS = ['**/_sources', '.#*', '**/.#*', '*.lproj/**']
+
+def read_config(confdir: str) -> SimpleNamespace:
+    """
+    Evaluate conf.py the way Sphinx does, and only keep the values that
+    this tool needs.
+    """
+    namespace = {"__file__": join(confdir, "conf.py"), "tags": set()}
+    cwd = os.getcwd()
+    os.chdir(confdir)
+    try:
+        with open("conf.py", "rb") as f:
+            code = compile(f.read(), namespace["__file__"], "exec")
+        exec(code, namespace)
+    finally:
+        os.chdir(cwd)
+    config = SimpleNamespace(**{
+        key: namespace.get(key, default)
+        for key, default in DEFAULT_CONFIG.items()
+    })
+    if config.translation_rewriting_rules is None:
+        config.translation_rewriting_rules = []
+        if "translation" in config.extensions:
+            from translation.project import DEFAULT_REWRITING_RULES
+            config.translation_rewriting_rules = DEFAULT_REWRITING_RULES
+    return config
+
+def rewrite_docname(docname: str, rewriting_rules: List[Tuple[str,str]]) -> str:
+    """Same as TranslatedProject.rewrite: the first matching rule is applied"""
+    for pattern, replacement in rewriting_rules:
+        if re.match(pattern, docname):
+            return re.sub(pattern, replacement, docname)
+    return docname
+
+def is_excluded(path: str, patterns: List[str]) -> bool:
+    """
+    Like Sphinx's exclude_patterns, a pattern excludes the paths it matches
+    and everything below them.
+    """
+    parts = path.split("/")
+    prefixes = ["/".join(parts[:i]) for i in range(1, len(parts) + 1)]
+    return any(
+        fnmatch(prefix, pattern)
+        for pattern in patterns
+        for prefix in prefixes
+    )
+
+def find_documents(srcdir: str, config, suffix: str = ".md") -> List[Tuple[str,str]]:
+    """
+    @return docnames and paths (relative to srcdir) of the source documents,
+            sorted in the order in which Sphinx reads them
+    """
+    patterns = config.exclude_patterns + EXCLUDE_PATHS
+    docnames = []
+    for root, dirs, files in os.walk(srcdir):
+        reldir = relpath(root, srcdir).replace(os.sep, "/")
+        reldir = "" if reldir == "." else reldir + "/"
+        dirs[:] = [d for d in dirs if not is_excluded(reldir + d, patterns)]
+        for filename in files:
+            if filename.endswith(suffix) and not is_excluded(reldir + filename, patterns):
+                path = reldir + filename
+                docname = rewrite_docname(path[:-len(suffix)], config.translation_rewriting_rules)
+                docnames.append((docname, path))
+    return sorted(docnames)
+
+#############################################################
+# Fence parsing
+
+class Directive(NamedTuple):
+    name: str
+    argument: str
+    options: Dict[str,str]
+    content: List[str]
+    lineno: int
+
+_FENCE_RE = re.compile(r"^(?P<indent>\s*)(?P<fence>`{3,}|~{3,})\s*(?P<info>.*?)\s*$")
+_DIRECTIVE_INFO_RE = re.compile(r"^\{(?P<name>[\w\-:]+)\}\s*(?P<argument>.*)$")
+_OPTION_RE = re.compile(r"^:(?P<key>[\w\-]+):\s*(?P<value>.*)$")
+
+# Directives whose content is collected
+LITERATE_DIRECTIVES = {'lit', 'lit-setup'}
+
+# Directives whose content is not Markdown, the content of other directives
+# is scanned for nested fences.
+RAW_CONTENT_DIRECTIVES = {'code-block', 'code', 'sourcecode', 'math', 'tangle', 'lit-registry'}
+
+def split_options(lines: List[str]) -> Tuple[Dict[str,str], List[str]]:
+    """
+    Split the options (':key: value' lines or a '---' delimited block) from
+    the content of a MyST directive.
+    """
+    options = {}
+    if lines and lines[0].strip() == "---":
+        for i in range(1, len(lines)):
+            if lines[i].strip() == "---":
+                for line in lines[1:i]:
+                    key, _, value = line.partition(":")
+                    options[key.strip()] = value.strip()
+                return options, lines[i+1:]
+        return options, lines
+    i = 0
+    while i < len(lines):
+        m = _OPTION_RE.match(lines[i])
+        if m is None:
+            break
+        options[m.group('key')] = m.group('value')
+        i += 1
+    if i > 0 and i < len(lines) and not lines[i].strip():
+        # Blank line after options
+        i += 1
+    return options, lines[i:]
+
+def iter_literate_directives(lines: List[str]) -> Iterator[Directive]:
+    """
+    Yield the {lit} and {lit-setup} directives of a Markdown document, in
+    order, including those nested in other fenced directives.
+    """
+    # Stack of open fences: (fence character, fence length, directive name,
+    # indentation, line number of the fence, collected content)
+    stack = []
+    for i, line in enumerate(lines):
+        top = stack[-1] if stack else None
+        m = _FENCE_RE.match(line)
+
+        if top is not None and top[2] != "container":
+            # Inside a code block or a literate directive
+            if (
+                m is not None and not m.group('info')
+                and m.group('fence')[0] == top[0] and len(m.group('fence')) >= top[1]
+            ):
+                stack.pop()
+                name = top[2]
+                if name in LITERATE_DIRECTIVES:
+                    options, content = split_options(top[5])
+                    yield Directive(name, top[3], options, content, top[4])
+            elif top[5] is not None:
+                indent = len(line) - len(line.lstrip(" "))
+                top[5].append(line[min(indent, len(top[6])):])
+            continue
+
+        if m is None:
+            continue
+
+        char, length, info = m.group('fence')[0], len(m.group('fence')), m.group('info')
+        if char == "`" and "`" in info:
+            # Not a fence but inline code
+            continue
+
+        if top is not None and not info and char == top[0] and length >= top[1]:
+            # End of a directive that contains Markdown
+            stack.pop()
+            continue
+
+        d = _DIRECTIVE_INFO_RE.match(info)
+        if d is not None and d.group('name') in LITERATE_DIRECTIVES:
+            stack.append([char, length, d.group('name'), d.group('argument'), i + 1, [], m.group('indent')])
+        elif d is not None and d.group('name') not in RAW_CONTENT_DIRECTIVES:
+            stack.append([char, length, "container", None, i + 1, None, m.group('indent')])
+        else:
+            stack.append([char, length, "code", None, i + 1, None, m.group('indent')])
+
+#############################################################
+# Reading
+
+def parse_document(srcdir: str, path: str) -> List[Directive]:
+    """
+    @param path of the document, relative to srcdir
+    """
+    with open(join(srcdir, path), "r", encoding="utf-8-sig") as f:
+        lines = f.read().splitlines()
+    return list(iter_literate_directives(lines))
+
+def register_document(registry: CodeBlockRegistry, srcdir: str, docname: str, directives: List[Directive], config) -> None:
+    """
+    Register the blocks of a document as LiterateSetupDirective and
+    LiterateDirective do.
+    """
+    # Same as Sphinx's env.temp_data for this document
+    env = SimpleNamespace(temp_data={})
+    serial = 0
+
+    for directive in directives:
+        source_location = SourceLocation(
+            docname = sys.intern(docname),
+            lineno = directive.lineno,
+        )
+
+        if directive.name == 'lit-setup':
+            options = directive.options
+            tangle_root = options.get('tangle-root')
+            alias = options.get('alias')
+            if tangle_root is not None and alias is None:
+                env.temp_data['tangle-root'] = tangle_root
+            if tangle_root is None:
+                tangle_root = env.temp_data['tangle-root']
+            if alias is not None:
+                env.temp_data.setdefault('tangle-aliases', {})[alias] = tangle_root
+            if options.get('parent') is not None:
+                registry.set_tangle_parent(
+                    tangle_root,
+                    options['parent'],
+                    source_location,
+                    # Sphinx is run from the source directory
+                    parse_fetched_files(options.get('fetch-files'), join(srcdir, docname)),
+                    'debug' in options,
+                )
+            continue
+
+        parsed_title = parse_block_title(directive.argument)
+        content = tuple(directive.content)
+        parsed_content = parse_block_content(
+            content,
+            config,
+            f"{docname}:{serial}",
+            location=(docname, directive.lineno + 1),
+        )
+        for tangle_root in get_tangle_roots_from_parsed_title(parsed_title, env):
+            lit = CodeBlock(
+                name = parsed_title.name,
+                tangle_root = tangle_root,
+                source_location = source_location,
+                content = content,
+                target_id = f"lit-{serial}",
+                lexer = parsed_title.lexer,
+            )
+            serial += 1
+            registry.register_codeblock(lit, parsed_title.options)
+            for link in parsed_content.links(tangle_root).values():
+                registry.add_reference(lit.key, link.key, docname)
+
+def read_project(srcdir: str, config) -> CodeBlockRegistry:
+    registry = CodeBlockRegistry()
+    for docname, path in find_documents(srcdir, config):
+        register_document(registry, srcdir, docname, parse_document(srcdir, path), config)
+    registry.finalize()
+    return registry
+
+#############################################################
+# Main
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m sphinx_literate.tangle_cli",
+        description="Tangle the literate code blocks of a MyST documentation without running Sphinx.",
+    )
+    parser.add_argument("srcdir", help="source directory of the documentation")
+    parser.add_argument("outdir", help="directory where tangled files are written")
+    parser.add_argument("-c", "--confdir", help="directory containing conf.py (default: srcdir)")
+    parser.add_argument("-w", "--watch", action="store_true", help="keep tangling the sources that change, until interrupted")
+    parser.add_argument("--interval", type=float, default=0.5, help="seconds between two scans of the sources in watch mode (default: 0.5)")
+    parser.add_argument("--poll", action="store_true", help="only detect changes by scanning the sources, without inotify")
+    args = parser.parse_args()
+
+    srcdir = abspath(args.srcdir)
+    if args.watch:
+        from .watch import TangleWatcher
+        try:
+            config = read_config(abspath(args.confdir or args.srcdir))
+        except ExtensionError as err:
+            sys.stderr.write(f"Error: {err.message}\n")
+            sys.exit(1)
+        config.exclude_patterns = config.exclude_patterns + [relpath(abspath(args.outdir), srcdir).replace(os.sep, "/")]
+        os.makedirs(args.outdir, exist_ok=True)
+        try:
+            TangleWatcher(srcdir, args.outdir, config).run(args.interval, args.poll)
+        except KeyboardInterrupt:
+            pass
+        return
+
+    start = time.perf_counter()
+    try:
+        config = read_config(abspath(args.confdir or args.srcdir))
+        # The build directory is usually in the source directory
+        config.exclude_patterns = config.exclude_patterns + [relpath(abspath(args.outdir), srcdir).replace(os.sep, "/")]
+        registry = read_project(srcdir, config)
+        os.makedirs(args.outdir, exist_ok=True)
+        write_tangled_tree(registry, config, args.outdir)
+    except ExtensionError as err:
+        sys.stderr.write(f"Error: {err.message}\n")
+        sys.exit(1)
+    elapsed = time.perf_counter() - start
+    roots = len(registry.all_tangle_roots())
+    sys.stderr.write(f"Tangled {roots} roots in {args.outdir} ({elapsed:.2f}s)\n")
+
+if __name__ == "__main__":
+    main()
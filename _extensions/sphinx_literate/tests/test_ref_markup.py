@@ -0,0 +1,97 @@
+"""
+Regression tests for the markup of references to literate blocks, which is
+memoized per builder (see create_ref in nodes.py):
+
+    cd _extensions
+    python -m pytest sphinx_literate/tests
+"""
+from os.path import join, dirname, abspath
+import io
+import re
+
+from sphinx.application import Sphinx
+
+EXTENSIONS_DIR = dirname(dirname(dirname(abspath(__file__))))
+
+#############################################################
+
+def build_html(srcdir, outdir, pages):
+    with open(join(srcdir, "conf.py"), "w", encoding="utf-8") as f:
+        f.write("\n".join([
+            "import sys",
+            f"sys.path.append({EXTENSIONS_DIR!r})",
+            "project = 'Literate references'",
+            "extensions = ['myst_parser', 'sphinx_literate']",
+            "",
+        ]))
+    for docname, content in pages.items():
+        with open(join(srcdir, docname + ".md"), "w", encoding="utf-8") as f:
+            f.write(content)
+    app = Sphinx(
+        str(srcdir),
+        str(srcdir),
+        str(outdir),
+        join(str(outdir), ".doctrees"),
+        "html",
+        status=None,
+        warning=io.StringIO(),
+        freshenv=True,
+    )
+    app.build()
+    return app
+
+def lit_ref_names(html):
+    return re.findall(r'<lit-ref name="([^"]*)"', html)
+
+#############################################################
+
+PARENT_PAGE = """\
+# Parent
+
+```{lit-setup}
+:tangle-root: Parent
+```
+
+```{lit} C++, Foo
+int foo;
+// marker
+```
+"""
+
+CHILD_PAGE = """\
+# Child
+
+```{lit-setup}
+:tangle-root: Child
+:parent: Parent
+```
+
+```{lit} C++, X (insert in {{Foo}} after "// marker")
+int x;
+```
+
+```{lit} C++, Use
+{{Foo}}
+{{X}}
+```
+"""
+
+def test_insert_modifier_and_inserted_block(tmp_path):
+    """
+    In the child tangle root, Foo resolves to the INSERT modifier, which has
+    the same location as the inserted block X, so their references must not
+    share the same memoized markup.
+    """
+    srcdir = tmp_path / "src"
+    outdir = tmp_path / "html"
+    srcdir.mkdir()
+    pages = {
+        "index": "# Index\n\n```{toctree}\nparent\nchild\n```\n",
+        "parent": PARENT_PAGE,
+        "child": CHILD_PAGE,
+    }
+    build_html(srcdir, outdir, pages)
+    with open(outdir / "child.html", encoding="utf-8") as f:
+        names = lit_ref_names(f.read())
+    assert "Foo" in names
+    assert "X" in names
@@ -1,3 +1,4 @@
+from functools import wraps
 import traceback
 
 def print_traceback(f):
@@ -5,10 +6,25 @@ def print_traceback(f):
     A decorator to display exception trace, because Sphinx hides them for
     some reason...
     """
+    @wraps(f)
     def wrapped(*args, **kwargs):
         try:
-            f(*args, **kwargs)
+            return f(*args, **kwargs)
         except Exception as err:
             print(traceback.format_exc())
             raise err
     return wrapped
+
+def relative_uri(builder, fromdocname: str, docname: str) -> str:
+    """
+    Memoized version of builder.get_relative_uri, which is called for every
+    link between literate blocks.
+    """
+    if not hasattr(builder, 'lit_relative_uris'):
+        builder.lit_relative_uris = {}
+    key = (fromdocname, docname)
+    uri = builder.lit_relative_uris.get(key)
+    if uri is None:
+        uri = builder.get_relative_uri(fromdocname, docname)
+        builder.lit_relative_uris[key] = uri
+    return uri
@@ -0,0 +1,255 @@
+"""
+Keep a tangled tree up to date while editing the documentation:
+
+    PYTHONPATH=_extensions python -m sphinx_literate.tangle_cli --watch . _build/tangle
+
+After a first full tangle, only the documents that changed are parsed again,
+and only the tangle roots that they affect (roots of the blocks and
+lit-setup directives of these documents, and all the roots that inherit
+from them) are tangled again. Files are only written when their content
+changed. Changes are detected with inotify on Linux, or by polling the
+modification times of the sources otherwise.
+"""
+
+from typing import Dict, List, Set, Tuple
+from os.path import join, exists
+import ctypes
+import ctypes.util
+import os
+import select
+import sys
+import time
+
+from sphinx.errors import ExtensionError
+
+from .builder import tangle_root_files, write_tangled_file, fetch_root_files, write_metadata
+from .registry import CodeBlockRegistry
+from .tangle_cli import Directive, find_documents, parse_document, register_document
+
+#############################################################
+# Change detection
+
+class PollingWaiter:
+    def watch(self, directories: List[str]) -> None:
+        pass
+
+    def wait(self, timeout: float) -> None:
+        time.sleep(timeout)
+
+class InotifyWaiter:
+    """
+    Wake up as soon as something changes in the watched directories. Events
+    are not decoded, sources are scanned again after any event.
+    """
+    IN_MODIFY = 0x002
+    IN_MOVED_FROM = 0x040
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_CLOSE_WRITE = 0x008
+    MASK = IN_MODIFY | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_CLOSE_WRITE
+
+    def __init__(self) -> None:
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watched: Set[str] = set()
+
+    def watch(self, directories: List[str]) -> None:
+        for directory in directories:
+            if directory in self.watched:
+                continue
+            if self.libc.inotify_add_watch(self.fd, os.fsencode(directory), self.MASK) >= 0:
+                self.watched.add(directory)
+
+    def wait(self, timeout: float) -> None:
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if readable:
+            # Editors often write a file in several steps
+            time.sleep(0.05)
+            try:
+                while os.read(self.fd, 65536):
+                    pass
+            except BlockingIOError:
+                pass
+
+def make_waiter(poll: bool):
+    if not poll and sys.platform.startswith("linux"):
+        try:
+            return InotifyWaiter()
+        except (OSError, AttributeError):
+            pass
+    return PollingWaiter()
+
+#############################################################
+
+class TangleWatcher:
+    def __init__(self, srcdir: str, outdir: str, config) -> None:
+        self.srcdir = srcdir
+        self.outdir = outdir
+        self.config = config
+
+        # Parsed documents, indexed by path (relative to srcdir)
+        self.documents: Dict[str,Tuple[str,List[Directive]]] = {}
+        self.mtimes: Dict[str,int] = {}
+
+        # Content of the files written for each tangle root, by file name
+        self.outputs: Dict[str|None,Dict[str,str]] = {}
+
+        self.registry = CodeBlockRegistry()
+
+        # Documents changed since the last successful update
+        self.pending_docnames: Set[str] = set()
+
+    def scan(self) -> Dict[str,Tuple[str,int]]:
+        """@return docname and modification time of sources, by path"""
+        sources = {}
+        for docname, path in find_documents(self.srcdir, self.config):
+            try:
+                sources[path] = (docname, os.stat(join(self.srcdir, path)).st_mtime_ns)
+            except OSError:
+                pass
+        return sources
+
+    def directories(self) -> List[str]:
+        return sorted({
+            join(self.srcdir, os.path.dirname(path))
+            for path in self.documents
+        })
+
+    def build_registry(self) -> CodeBlockRegistry:
+        """Register all documents again, in the order Sphinx reads them"""
+        registry = CodeBlockRegistry()
+        for path, (docname, directives) in sorted(self.documents.items(), key=lambda kv: kv[1][0]):
+            register_document(registry, self.srcdir, docname, directives, self.config)
+        registry.finalize()
+        return registry
+
+    def affected_roots(self, registry: CodeBlockRegistry, docnames: Set[str]) -> Set[str|None]:
+        """
+        Tangle roots whose tangled files may depend on the given documents
+        """
+        roots = set()
+        for lit in registry.blocks():
+            while lit is not None:
+                if lit.source_location.docname in docnames:
+                    roots.add(lit.tangle_root)
+                lit = lit.next
+        for tangle_root in registry.all_tangle_roots():
+            info = registry.get_tangle_info(tangle_root)
+            if info is not None and info.source_location.docname in docnames:
+                roots.add(tangle_root)
+        for tangle_root in list(roots):
+            roots.update(registry._all_children_tangle_roots(tangle_root))
+        return roots
+
+    def tangle_root(self, tangle_root: str | None) -> Tuple[int,int]:
+        """
+        Tangle a root and write the files that changed
+        @return number of files written and of files tangled
+        """
+        previous = self.outputs.get(tangle_root, {})
+        current = {
+            filename: '\n'.join(tangled_content)
+            for filename, tangled_content in tangle_root_files(self.registry, tangle_root, self.config).items()
+        }
+        written = 0
+        for filename, content in current.items():
+            outfilename = join(self.outdir, filename)
+            if filename not in previous and exists(outfilename):
+                with open(outfilename, 'r', encoding='utf-8') as f:
+                    previous[filename] = f.read()
+            if previous.get(filename) != content:
+                write_tangled_file(outfilename, content.split('\n'))
+                written += 1
+        for filename in previous.keys() - current.keys():
+            # The block of this file was removed
+            outfilename = join(self.outdir, filename)
+            if exists(outfilename):
+                os.remove(outfilename)
+                written += 1
+        self.outputs[tangle_root] = current
+        return written, len(current)
+
+    def update(self, sources: Dict[str,Tuple[str,int]]) -> None:
+        start = time.perf_counter()
+        changed = {
+            path
+            for path in sources.keys() | self.mtimes.keys()
+            if self.mtimes.get(path) != (sources[path][1] if path in sources else None)
+        }
+        if not changed:
+            return
+        first_update = not self.outputs
+
+        changed_docnames = self.pending_docnames
+        for path in changed:
+            if path in self.documents:
+                changed_docnames.add(self.documents[path][0])
+            if path in sources:
+                docname, mtime = sources[path]
+                self.mtimes[path] = mtime
+                self.documents[path] = (docname, parse_document(self.srcdir, path))
+                changed_docnames.add(docname)
+            else:
+                self.mtimes.pop(path, None)
+                self.documents.pop(path, None)
+
+        previous_registry = self.registry
+        self.registry = self.build_registry()
+        previous_roots = set(previous_registry.all_tangle_roots())
+        roots = set(self.registry.all_tangle_roots())
+
+        if first_update:
+            affected = roots
+        else:
+            # Roots that no longer exist are affected as well, to clear
+            # their files.
+            affected = (
+                self.affected_roots(previous_registry, changed_docnames)
+                | self.affected_roots(self.registry, changed_docnames)
+                | (previous_roots - roots)
+            )
+
+        written = 0
+        tangled = 0
+        for tangle_root in affected:
+            if tangle_root not in roots:
+                # Removed root: clear its files
+                for filename in self.outputs.pop(tangle_root, {}):
+                    outfilename = join(self.outdir, filename)
+                    if exists(outfilename):
+                        os.remove(outfilename)
+                        written += 1
+                continue
+            root_written, root_tangled = self.tangle_root(tangle_root)
+            written += root_written
+            tangled += root_tangled
+
+            previous_info = previous_registry.get_tangle_info(tangle_root)
+            info = self.registry.get_tangle_info(tangle_root)
+            previous_fetch_files = previous_info.fetch_files if previous_info is not None else []
+            fetch_files = info.fetch_files if info is not None else []
+            if first_update or fetch_files != previous_fetch_files:
+                fetch_root_files(self.registry, tangle_root, self.outdir)
+
+        write_metadata(self.registry, self.config, self.outdir)
+        self.pending_docnames = set()
+
+        elapsed = time.perf_counter() - start
+        sys.stderr.write(
+            f"{len(changed)} document(s) changed, {len(affected)} tangle root(s) affected: " +
+            f"{written} of {tangled} file(s) written ({elapsed:.2f}s)\n"
+        )
+
+    def run(self, interval: float = 0.5, poll: bool = False) -> None:
+        waiter = make_waiter(poll)
+        while True:
+            try:
+                self.update(self.scan())
+            except ExtensionError as err:
+                # Most likely a block being edited, keep watching
+                sys.stderr.write(f"Error: {err.message}\n")
+            waiter.watch([self.srcdir] + self.directories())
+            waiter.wait(interval)
@@ -1,6 +1,12 @@
 """
 This extension defines the 'translation-warning' directive, that is displayed
 only when a page is older than the one it is supposed to be a translation of.
+
+It also provides a 'translation-status' builder that reports, for all pages
+and all languages at once, which translations exist and which are stale.
+
+Setting 'translation_build_language' restricts a build to the pages of a
+single language, reusing the environment of the last full build.
 """
 
 from sphinx.application import Sphinx
@@ -9,6 +15,8 @@ from .directives import setup as setup_directives
 from .config import setup as setup_config
 from .handlers import setup as setup_handlers
 from .project import setup as setup_project
+from .scope import setup as setup_scope
+from .builder import TranslationStatusBuilder
 
 #############################################################
 # Setup
@@ -22,6 +30,10 @@ def setup(app: Sphinx):
 
     setup_project(app)
 
+    setup_scope(app)
+
+    app.add_builder(TranslationStatusBuilder)
+
     return {
         'version': '0.1',
         'parallel_read_safe': True,
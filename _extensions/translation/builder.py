@@ -0,0 +1,246 @@
+from docutils.nodes import Node
+
+from sphinx.builders import Builder
+from sphinx.locale import __
+from sphinx.util import logging
+from sphinx.util.osutil import ensuredir
+
+from os.path import join
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+from dataclasses import dataclass, field
+import json
+
+from .directives import git
+from .handlers import build_translation_index
+
+logger = logging.getLogger(__name__)
+
+#############################################################
+# Git history
+
+@dataclass
+class FileHistory:
+    """
+    Changes of a single file, from the most recent to the oldest commit.
+    """
+
+    # Each entry is (short commit hash, commit timestamp, lines changed)
+    commits: List[Tuple[str, int, int]] = field(default_factory=list)
+
+    @property
+    def last_change(self) -> Tuple[str, int] | None:
+        if not self.commits:
+            return None
+        commit, timestamp, _ = self.commits[0]
+        return commit, timestamp
+
+    def lines_changed_since(self, timestamp: int) -> int:
+        """
+        Lines changed by the commits made at or after the given time, which
+        are the ones that make a translation of this time stale.
+        """
+        return sum(
+            lines
+            for _, commit_timestamp, lines in self.commits
+            if commit_timestamp >= timestamp
+        )
+
+def read_git_history(srcdir: str) -> Dict[str, FileHistory]:
+    """
+    Read the whole history of the source directory in a single git call.
+    @return history of each file, indexed by its path relative to srcdir
+    """
+    log = git(
+        "-c", "core.quotePath=false",
+        "log", "--no-renames", "--relative", "--format=%x00%h;%ct", "--numstat",
+        "--", ".",
+        cwd=srcdir,
+    )
+
+    history = {}
+    for chunk in log.split("\0")[1:]:
+        header, _, numstat = chunk.partition("\n")
+        commit, timestamp = header.split(";")
+        timestamp = int(timestamp)
+        for line in numstat.splitlines():
+            if not line:
+                continue
+            added, deleted, path = line.split("\t", 2)
+            # Binary files are reported with '-' instead of line counts
+            lines = 0 if added == '-' else int(added) + int(deleted)
+            history.setdefault(path, FileHistory()).commits.append((commit, timestamp, lines))
+    return history
+
+#############################################################
+# Builder
+
+class TranslationStatusBuilder(Builder):
+    """
+    Report which pages are translated in which language and which
+    translations are older than their original, from the git history only
+    (no source document is parsed).
+    """
+    name = 'translation-status'
+    format = 'translation-status'
+    epilog = __('The translation status report is in %(outdir)s.')
+
+    default_lang = "en"
+
+    # Inherited methods
+
+    def init(self) -> None:
+        pass
+
+    def get_outdated_docs(self) -> Iterator[str]:
+        return iter(())
+
+    def get_target_uri(self, docname: str, typ: Optional[str] = None) -> str:
+        return ""
+
+    def prepare_writing(self, docnames: Set[str]) -> None:
+        pass
+
+    def write_doc(self, docname: str, doctree: Node) -> None:
+        pass
+
+    # Reading the documents is not needed, so we bypass the regular build
+
+    def build_all(self) -> None:
+        self.write_status()
+
+    def build_specific(self, filenames: List[str]) -> None:
+        self.write_status()
+
+    def build_update(self) -> None:
+        self.write_status()
+
+    # Internal methods
+
+    def write_status(self) -> None:
+        languages = [
+            lang[0]
+            for lang in self.config.translation_languages
+            if lang[0] != self.default_lang
+        ]
+
+        project = self.app.project
+        exclude_paths = [
+            *self.config.exclude_patterns,
+            *self.config.templates_path,
+        ]
+        docnames = project.discover(exclude_paths, self.config.include_patterns)
+        index = build_translation_index(docnames, self.config.translation_languages, self.default_lang)
+        history = read_git_history(self.srcdir)
+        if not history:
+            logger.warning(__("no git history found in %s, all pages are reported as uncommitted"), self.srcdir)
+
+        pages = {}
+        for docname in sorted(index):
+            available = index[docname]
+            if self.default_lang not in available:
+                # Translation without original, reported with the original pages
+                continue
+            original_path = project.doc2path(docname, absolute=False)
+            original = self.file_status(original_path, history)
+            page = { self.default_lang: original }
+            for lang in languages:
+                if lang not in available:
+                    page[lang] = { "exists": False }
+                    continue
+                translated_path = project.doc2path(f"{lang}/{docname}", absolute=False)
+                page[lang] = self.translation_status(translated_path, original_path, history)
+            pages[docname] = page
+
+        orphans = sorted(
+            f"{lang}/{docname}"
+            for docname, available in index.items()
+            if self.default_lang not in available
+            for lang in available
+        )
+
+        report = {
+            "languages": languages,
+            "pages": pages,
+            "orphans": orphans,
+        }
+
+        ensuredir(self.outdir)
+        with open(join(self.outdir, "translation-status.json"), "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        with open(join(self.outdir, "translation-status.txt"), "w", encoding="utf-8") as f:
+            f.write("\n".join(self.format_matrix(report)) + "\n")
+
+    def file_status(self, path: str, history: Dict[str, FileHistory]) -> Dict:
+        last_change = history.get(path, FileHistory()).last_change
+        return {
+            "exists": True,
+            "path": path,
+            "commit": last_change[0] if last_change is not None else None,
+            "timestamp": last_change[1] if last_change is not None else None,
+        }
+
+    def translation_status(self, path: str, original_path: str, history: Dict[str, FileHistory]) -> Dict:
+        status = self.file_status(path, history)
+        original_history = history.get(original_path, FileHistory())
+        original_change = original_history.last_change
+
+        if status["timestamp"] is None:
+            # Not committed yet, so more recent than anything (same as in the
+            # translation-warning directive).
+            stale = False
+            lines_changed = 0
+        elif original_change is None:
+            # The original is not committed yet, so it changed now, after the
+            # translation (same as in the translation-warning directive), and
+            # all of its lines are new.
+            stale = True
+            with open(join(self.srcdir, original_path), encoding="utf-8") as f:
+                lines_changed = sum(1 for _ in f)
+        else:
+            # Same criterion as the translation-warning directive
+            stale = status["timestamp"] <= original_change[1]
+            lines_changed = original_history.lines_changed_since(status["timestamp"]) if stale else 0
+
+        status["stale"] = stale
+        status["lines_changed"] = lines_changed
+        return status
+
+    def format_matrix(self, report: Dict) -> List[str]:
+        """Human readable version of the report, one row per page"""
+        def format_date(timestamp):
+            if timestamp is None:
+                return "uncommitted"
+            return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%d")
+
+        def format_cell(status):
+            if not status["exists"]:
+                return "-"
+            if status["stale"]:
+                return f"stale (+{status['lines_changed']})"
+            return f"ok {format_date(status['timestamp'])}"
+
+        columns = [self.default_lang] + report["languages"]
+        rows = [["page"] + columns]
+        for docname, page in report["pages"].items():
+            rows.append(
+                [docname, format_date(page[self.default_lang]["timestamp"])]
+                + [format_cell(page[lang]) for lang in report["languages"]]
+            )
+
+        widths = [max(len(row[i]) for row in rows) for i in range(len(columns) + 1)]
+        lines = [
+            "  ".join(cell.ljust(w) for cell, w in zip(row, widths)).rstrip()
+            for row in rows
+        ]
+        lines.insert(1, "  ".join("-" * w for w in widths))
+
+        total = len(report["pages"])
+        lines.append("")
+        for lang in report["languages"]:
+            translated = sum(1 for page in report["pages"].values() if page[lang]["exists"])
+            stale = sum(1 for page in report["pages"].values() if page[lang].get("stale"))
+            lines.append(f"{lang}: {translated}/{total} pages translated, {stale} stale")
+        for orphan in report["orphans"]:
+            lines.append(f"Warning: translated page without original: {orphan}")
+        return lines
@@ -1,5 +1,7 @@
 from typing import List, Tuple
 
+from .project import DEFAULT_REWRITING_RULES
+
 def setup(app):
     app.add_css_file("diff-admonition.css")
     app.add_js_file("diff-admonition.js")
@@ -8,3 +10,14 @@ def setup(app):
 
     # Each entry is (short language name, emoji, language name, english language name)
     app.add_config_value("translation_languages", [], 'html', List[Tuple[str, str, str, str]])
+
+    # Maximum number of rendered local toctree fragments kept in memory
+    app.add_config_value("translation_toctree_cache_size", 256, 'html', [int])
+
+    # When set to a short language name, only build the pages of this language
+    # (see scope.py)
+    app.add_config_value("translation_build_language", None, 'env', [str])
+
+    # Rules (pattern, replacement) applied to the path of source files to get
+    # their docname. Only the first matching rule is applied.
+    app.add_config_value("translation_rewriting_rules", DEFAULT_REWRITING_RULES, 'env', [list])
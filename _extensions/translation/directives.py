@@ -12,8 +12,8 @@ import time
 
 #############################################################
 
-def git(*args):
-    return subprocess.run(["git", *args], capture_output=True).stdout.decode()
+def git(*args, cwd=None):
+    return subprocess.run(["git", *args], capture_output=True, cwd=cwd).stdout.decode()
 
 #############################################################
 
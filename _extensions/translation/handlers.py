@@ -1,6 +1,8 @@
-from typing import Dict, Any, List, Tuple
+from __future__ import annotations
+from typing import Dict, Any, Iterable, List, Set, Tuple
 from os.path import dirname, join
 from dataclasses import dataclass
+from collections import defaultdict, OrderedDict
 
 from sphinx.application import Sphinx
 from sphinx.locale import _
@@ -14,6 +16,7 @@ from sphinx.builders import Builder
 from docutils.nodes import Element
 
 from .utils import print_traceback
+from .scope import get_reference_env
 
 from docutils import nodes
 from sphinx.errors import ExtensionError
@@ -38,6 +41,19 @@ def on_doctree_resolved(app: Sphinx, doctree, fromdocname: str):
 
 ####################################################
 
+@print_traceback
+def on_env_updated(app: Sphinx, env):
+    docnames = set(env.found_docs)
+    if reference_env := get_reference_env(app):
+        # Pages out of the language scope are still listed in the switcher
+        docnames.update(reference_env.all_docs)
+    env.translation_index = build_translation_index(docnames, app.config.translation_languages)
+
+    # Toctree includes may have changed since the cache was filled
+    app.builder.translation_toctree_cache = None
+
+####################################################
+
 @print_traceback
 def on_build_finished(app: Sphinx, exc):
     asset_files = [
@@ -53,8 +69,87 @@ def on_build_finished(app: Sphinx, exc):
 
 #############################################################
 
-def get_local_master(env: BuildEnvironment, docname: str):
+class LocalToctreeCache:
+    """
+    Memoize the different steps of the local toctree rendering for the
+    duration of a build: the local master of each document, the toctree nodes
+    of each local master and the rendered fragments (with LRU eviction).
+    NB: Do not create this yourself, call LocalToctreeCache.from_builder(builder)
+    """
+
+    @classmethod
+    def from_builder(cls, builder: Builder) -> LocalToctreeCache:
+        if getattr(builder, 'translation_toctree_cache', None) is None:
+            builder.translation_toctree_cache = LocalToctreeCache(
+                builder.env,
+                builder.config.translation_toctree_cache_size,
+            )
+        return builder.translation_toctree_cache
+
+    def __init__(self, env: BuildEnvironment, maxsize: int) -> None:
+        self.env = env
+        self.maxsize = maxsize
+
+        # Maps each document to the document that includes it in its toctree
+        self._parents: Dict[str, str] | None = None
+
+        # Maps each document to its local master
+        self._local_masters: Dict[str, str] = {}
+
+        # Maps each local master to the toctree nodes found in its doctree
+        self._master_toctrees: Dict[str, List[addnodes.toctree]] = {}
+
+        # Rendered fragments indexed by (local master, docname, kwargs)
+        self._fragments: OrderedDict[Tuple, str] = OrderedDict()
+
+    def get_local_master(self, docname: str) -> str:
+        if docname not in self._local_masters:
+            if self._parents is None:
+                self._parents = {}
+                for parent, children in self.env.toctree_includes.items():
+                    self._parents |= dict.fromkeys(children, parent)
+            # Same walk as _get_toctree_ancestors, we only need the last one
+            ancestor = None
+            visited = set()
+            d = docname
+            while d in self._parents and d not in visited:
+                visited.add(d)
+                ancestor = d
+                d = self._parents[d]
+            self._local_masters[docname] = (
+                ancestor if ancestor is not None else self.env.config.root_doc
+            )
+        return self._local_masters[docname]
+
+    def get_master_toctrees(self, local_master: str) -> List[addnodes.toctree]:
+        if local_master not in self._master_toctrees:
+            doctree = self.env.get_doctree(local_master)
+            self._master_toctrees[local_master] = list(doctree.findall(addnodes.toctree))
+        return self._master_toctrees[local_master]
+
+    def get_fragment(self, builder: Builder, docname: str, **kwargs: Any) -> str:
+        key = (
+            self.get_local_master(docname),
+            docname,
+            tuple(sorted(kwargs.items())),
+        )
+        fragment = self._fragments.get(key)
+        if fragment is not None:
+            self._fragments.move_to_end(key)
+            return fragment
+
+        toctree = toctree_for_doc_no_toplevel(self.env, docname, builder, **kwargs)
+        fragment = builder.render_partial(toctree)['fragment']
+
+        self._fragments[key] = fragment
+        if len(self._fragments) > self.maxsize:
+            self._fragments.popitem(last=False)
+        return fragment
+
+def get_local_master(env: BuildEnvironment, docname: str, builder: Builder | None = None):
     """Return the name of the document used as master root for a given doc"""
+    if builder is not None:
+        return LocalToctreeCache.from_builder(builder).get_local_master(docname)
     all_ancestors = list(_get_toctree_ancestors(env.toctree_includes, docname))
     if all_ancestors:
         return all_ancestors[-1]
@@ -67,8 +162,8 @@ def get_local_toctree_no_toplevel(builder: Builder, docname: str, collapse: bool
         kwargs['includehidden'] = False
     if kwargs.get('maxdepth') == '':
         kwargs.pop('maxdepth')
-    toctree = toctree_for_doc_no_toplevel(builder.env, docname, builder, collapse=collapse, **kwargs)
-    return builder.render_partial(toctree)['fragment']
+    cache = LocalToctreeCache.from_builder(builder)
+    return cache.get_fragment(builder, docname, collapse=collapse, **kwargs)
 
 def toctree_for_doc_no_toplevel(
     env: BuildEnvironment,
@@ -82,10 +177,11 @@ def toctree_for_doc_no_toplevel(
     """Variant of environment.adapters.toctree that does not return the top level"""
 
     # Find ancestor that serves as sub root
-    ancestor = get_local_master(env, docname)
+    cache = LocalToctreeCache.from_builder(builder)
+    ancestor = cache.get_local_master(docname)
 
     toctrees: list[Element] = []
-    for toctree_node in env.get_doctree(ancestor).findall(addnodes.toctree):
+    for toctree_node in cache.get_master_toctrees(ancestor):
         if toctree := _resolve_toctree(
             env,
             docname,
@@ -113,8 +209,32 @@ class TranslationMetadata:
     language_name_en: str
     translated_docname: str
 
+def build_translation_index(
+    docnames: Iterable[str],
+    translation_languages: List[Tuple[str, str, str, str]],
+    default_lang: str = "en",
+) -> Dict[str, Set[str]]:
+    """
+    Map each docname (without language prefix) to the set of short language
+    names in which the page exists. This only looks at docnames (typically
+    env.found_docs) so that no doctree has to be loaded.
+    """
+    prefixes = {
+        lang[0]
+        for lang in translation_languages
+        if lang[0] != default_lang
+    }
+    index = defaultdict(set)
+    for docname in docnames:
+        lang, _sep, docname_default = docname.partition("/")
+        if lang in prefixes and docname_default:
+            index[docname_default].add(lang)
+        else:
+            index[docname].add(default_lang)
+    return index
+
 def get_translation(
-    env: BuildEnvironment,
+    translation_index: Dict[str, Set[str]],
     docname_default: str,
     language_info: Tuple[str, str, str, str],
     current_lang: str,
@@ -127,9 +247,7 @@ def get_translation(
     else:
         translated_docname = docname_default
 
-    try:
-        env.get_doctree(translated_docname)
-    except FileNotFoundError:
+    if short_language_name not in translation_index.get(docname_default, ()):
         return None
 
     return TranslationMetadata(
@@ -159,9 +277,13 @@ def get_all_translations(
         # Remove language prefix
         docname_default = docname[len(current_lang)+1:]
 
+    # Normally built once per build in on_env_updated
+    if not hasattr(env, 'translation_index'):
+        env.translation_index = build_translation_index(env.found_docs, translation_languages, default_lang)
+
     all_translations = []
     for lang in translation_languages:
-        if tr := get_translation(env, docname_default, lang, current_lang, default_lang):
+        if tr := get_translation(env.translation_index, docname_default, lang, current_lang, default_lang):
             all_translations.append(tr)
     return all_translations
 
@@ -177,7 +299,7 @@ def on_html_page_context(
     env = builder.env
 
     context["toctree"] = lambda **kwargs: get_local_toctree_no_toplevel(builder, docname, **kwargs)
-    context["master_doc"] = get_local_master(env, docname)
+    context["master_doc"] = get_local_master(env, docname, builder)
     context["translations"] = get_all_translations(env, docname, app.config.translation_languages)
 
 #############################################################
@@ -197,6 +319,7 @@ def setup(app):
     #app.connect('doctree-resolved', on_doctree_resolved)
     #app.connect('env-purge-doc', on_env_purge_doc)
     #app.connect('env-merge-info', on_env_merge_info)
+    app.connect('env-updated', on_env_updated)
     app.connect('build-finished', on_build_finished)
     app.connect('html-page-context', on_html_page_context)
     #app.connect('doctree-read', on_doctree_read)
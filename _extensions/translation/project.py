@@ -1,45 +1,149 @@
 import contextlib
 import os
 import re
-from typing import TYPE_CHECKING
+from functools import partial
+from typing import TYPE_CHECKING, Dict, List, Tuple
 
-from sphinx.project import Project
+from sphinx.errors import ExtensionError
+from sphinx.locale import __
+from sphinx.project import Project, EXCLUDE_PATHS
+from sphinx.util import logging
+from sphinx.util.matching import get_matching_files
 from sphinx.util.osutil import path_stabilize, relpath
 
 from collections.abc import Iterable
 
+logger = logging.getLogger(__name__)
+
+#############################################################
+
+# matched pattern, replacement string (using \1 for the 1-st match group, etc.)
+DEFAULT_REWRITING_RULES = [
+    (r"^translation/", ""),
+]
+
 #############################################################
 
 class TranslatedProject(Project):
-    def __init__(self, srcdir: str | os.PathLike[str], source_suffix: Iterable[str]) -> None:
+    def __init__(
+        self,
+        srcdir: str | os.PathLike[str],
+        source_suffix: Iterable[str],
+        rewriting_rules: List[Tuple[str, str]] = DEFAULT_REWRITING_RULES,
+        only_language: str | None = None,
+        always_included: Iterable[str] = (),
+    ) -> None:
         super().__init__(srcdir, source_suffix)
 
+        # When set, only the documents of this language (plus the ones listed
+        # in always_included) are part of the project (see scope.py)
+        self.only_language = only_language
+        self.always_included = set(always_included)
+
         # Only the first matching rule is applied, there is no possible cascade
         self.rewriting_rules = [
-            # matched pattern, replacement string (using \1 for the 1-st match group, etc.)
-            (r"^translation/", "")
+            (re.compile(pattern), replacement)
+            for pattern, replacement in rewriting_rules
         ]
 
+        # Memoized result of the rewriting rules, indexed by original docname
+        self._rewritten: Dict[str, str] = {}
+
+    def rewrite(self, docname: str) -> str:
+        """Apply the first matching rewriting rule to a docname."""
+        try:
+            return self._rewritten[docname]
+        except KeyError:
+            pass
+
+        rewritten = docname
+        for pattern, replacement in self.rewriting_rules:
+            if pattern.match(docname):
+                rewritten = pattern.sub(replacement, docname)
+                break
+
+        self._rewritten[docname] = rewritten
+        return rewritten
+
     def path2doc(self, filename: str | os.PathLike[str]) -> str | None:
         """Return the docname for the filename if the file is a document.
 
         *filename* should be absolute or relative to the source directory.
         """
+        # Discovered files are indexed with their already rewritten docname
+        try:
+            return self._path_to_docname[filename]
+        except KeyError:
+            pass
+
         docname = super().path2doc(filename)
-        
+
         if docname is None:
             return None
 
-        # Rewriting
-        for pattern, replacement in self.rewriting_rules:
-            if re.match(pattern, docname):
-                docname = re.sub(pattern, replacement, docname)
-                break
+        return self.rewrite(docname)
+
+    def discover(
+        self, exclude_paths: Iterable[str] = (), include_paths: Iterable[str] = ('**',)
+    ) -> set[str]:
+        """Variant of Project.discover that fails when two source files are
+        rewritten to the same docname, and applies the language scope."""
+        self.docnames.clear()
+        self._path_to_docname.clear()
+        self._docname_to_path.clear()
+
+        if self.only_language is not None:
+            prefix = self.only_language + "/"
+        else:
+            prefix = None
+
+        # Source path of all docnames, including the ones out of scope
+        seen: Dict[str, str] = {}
+
+        for filename in get_matching_files(
+            self.srcdir,
+            include_paths,
+            [*exclude_paths, *EXCLUDE_PATHS],
+        ):
+            docname = self.path2doc(filename)
+            if not docname:
+                continue
+
+            if docname in seen:
+                message = (
+                    f"Two source files are mapped to the same document '{docname}':\n" +
+                    f"  - {seen[docname]}\n" +
+                    f"  - {filename}\n" +
+                    f"Check 'translation_rewriting_rules'."
+                )
+                raise ExtensionError(message, modname="translation")
+            seen[docname] = filename
+
+            if prefix is not None and not docname.startswith(prefix) and docname not in self.always_included:
+                continue
+
+            if os.access(os.path.join(self.srcdir, filename), os.R_OK):
+                self.docnames.add(docname)
+                self._path_to_docname[filename] = docname
+                self._docname_to_path[docname] = filename
+            else:
+                logger.warning(
+                    __('Ignored unreadable document %r.'), filename, location=docname
+                )
+
+        return self.docnames
+
+#############################################################
 
-        return docname
+def on_config_inited(app, config):
+    app.project_class = partial(
+        TranslatedProject,
+        rewriting_rules=config.translation_rewriting_rules,
+    )
 
 #############################################################
 # Setup
 
 def setup(app):
     app.project_class = TranslatedProject
+    app.connect('config-inited', on_config_inited)
@@ -0,0 +1,206 @@
+"""
+Language-scoped builds: when 'translation_build_language' is set (typically
+with `-D translation_build_language=ru`), only the documents of this language
+are read and written. The environment of the last full build is loaded
+read-only to resolve references to pages that are out of scope, to list
+the available translations in the language switcher and to give pages the
+same previous/next/parent links as in the full build.
+
+The root document is read, because Sphinx requires it, but not written, and
+neither are the pages that list all documents (general index, search index,
+object inventory, etc.), so that the output of the full build is only updated
+with the pages of the language.
+"""
+
+from functools import partial
+from os.path import join, exists
+import logging as python_logging
+import pickle
+
+from docutils import nodes
+from sphinx import addnodes
+from sphinx.application import Sphinx
+from sphinx.environment import BuildEnvironment
+from sphinx.locale import __
+from sphinx.transforms.post_transforms import SphinxPostTransform
+from sphinx.util import logging
+from sphinx.util.nodes import make_refnode
+
+from .utils import print_traceback
+
+logger = logging.getLogger(__name__)
+
+ENV_PICKLE_FILENAME = 'environment.pickle'
+
+# Methods of the html builder that write outputs listing all documents, they
+# are left as written by the full build
+GLOBAL_OUTPUT_METHODS = [
+    'gen_indices',
+    'gen_pages_from_extensions',
+    'gen_additional_pages',
+    'dump_search_index',
+    'dump_inventory',
+]
+
+#############################################################
+
+def get_reference_env(app: Sphinx) -> BuildEnvironment | None:
+    """
+    Return the read-only environment of the full build when building a single
+    language, None otherwise.
+    """
+    return getattr(app, 'translation_reference_env', None)
+
+def load_reference_env(doctreedir: str) -> BuildEnvironment | None:
+    filename = join(doctreedir, ENV_PICKLE_FILENAME)
+    if not exists(filename):
+        return None
+    with open(filename, 'rb') as f:
+        return pickle.load(f)
+
+def is_in_scope(docname: str, language: str) -> bool:
+    return docname.startswith(language + "/")
+
+#############################################################
+
+class ReferenceEnvironmentResolver(SphinxPostTransform):
+    """
+    Resolve links to documents that are out of the current language scope
+    using the environment of the full build. This must run before MyST's own
+    resolver, which would otherwise report them as missing.
+    """
+    default_priority = 8
+
+    def run(self, **kwargs) -> None:
+        reference_env = get_reference_env(self.app)
+        if reference_env is None:
+            return
+
+        for node in self.document.findall(addnodes.pending_xref):
+            if node['reftype'] == 'myst' and node['refdomain'] == 'doc':
+                ref_docname = node['reftarget']
+                ref_id = node.get('reftargetid')
+            elif node['reftype'] == 'doc' and node['refdomain'] == 'std':
+                ref_docname = node['reftarget']
+                ref_id = None
+            else:
+                continue
+
+            if ref_docname in self.env.all_docs or ref_docname not in reference_env.all_docs:
+                continue
+
+            targetid = ""
+            if ref_id:
+                slug_to_section = reference_env.metadata[ref_docname].get("myst_slugs", {})
+                targetid = slug_to_section.get(ref_id, (None, ref_id, None))[1]
+
+            if node.get('refexplicit', False):
+                innernode = nodes.inline(node.astext(), "", classes=["std", "std-doc"])
+                innernode.extend(node[0].children)
+            else:
+                title = reference_env.titles[ref_docname].astext()
+                innernode = nodes.inline(title, title, classes=["std", "std-doc"])
+
+            from_docname = node.get('refdoc', self.env.docname)
+            node.replace_self(make_refnode(self.app.builder, from_docname, ref_docname, targetid, innernode))
+
+#############################################################
+
+class OutOfScopeToctreeFilter(python_logging.Filter):
+    """
+    Drop the warnings about toctree entries that are missing only because
+    they are out of the language scope (e.g. other languages in the toctree
+    of the root document), they exist in the full build.
+    """
+    def __init__(self, reference_env: BuildEnvironment) -> None:
+        super().__init__()
+        self.reference_env = reference_env
+
+    def filter(self, record: python_logging.LogRecord) -> bool:
+        if getattr(record, 'type', None) != 'toc' or getattr(record, 'subtype', None) != 'not_readable':
+            return True
+        return not (record.args and record.args[0] in self.reference_env.all_docs)
+
+def restrict_writing(builder, language: str, reference_env: BuildEnvironment | None) -> None:
+    """
+    Only write the documents of the language, with the relations (previous,
+    next and parent pages) and titles of the full build.
+    """
+    prepare_writing = builder.prepare_writing
+
+    def scoped_prepare_writing(docnames):
+        # Sphinx always adds the root document, the set is written after this
+        docnames.difference_update([
+            docname
+            for docname in docnames
+            if not is_in_scope(docname, language)
+        ])
+        if not docnames:
+            # The parallel writer expects at least one document
+            builder.parallel_ok = False
+
+        prepare_writing(docnames)
+
+        if reference_env is not None and hasattr(builder, 'relations'):
+            builder.relations = {
+                **builder.relations,
+                **reference_env.collect_relations(),
+            }
+            for docname, title in reference_env.titles.items():
+                builder.env.titles.setdefault(docname, title)
+
+    builder.prepare_writing = scoped_prepare_writing
+
+    for name in GLOBAL_OUTPUT_METHODS:
+        if hasattr(builder, name):
+            setattr(builder, name, lambda: None)
+
+#############################################################
+
+@print_traceback
+def on_config_inited(app: Sphinx, config):
+    language = config.translation_build_language
+    if not language:
+        return
+
+    # Keep the environment of the full build untouched, and read it as the
+    # reference environment.
+    app.translation_reference_doctreedir = app.doctreedir
+    app.doctreedir = type(app.doctreedir)(join(app.doctreedir, language))
+
+    app.project_class = partial(
+        app.project_class,
+        only_language=language,
+        # Required by Sphinx to read the project, but not written
+        always_included=[config.root_doc],
+    )
+
+@print_traceback
+def on_builder_inited(app: Sphinx):
+    language = app.config.translation_build_language
+    if not language:
+        return
+
+    reference_env = load_reference_env(app.translation_reference_doctreedir)
+    if reference_env is None:
+        logger.warning(
+            __("no environment found in %s, run a full build first to resolve links to pages out of language '%s'"),
+            app.translation_reference_doctreedir,
+            language,
+        )
+    app.translation_reference_env = reference_env
+
+    if reference_env is not None:
+        for handler in python_logging.getLogger(logging.NAMESPACE).handlers:
+            # Before the filter that turns warnings into errors with -W
+            handler.filters.insert(0, OutOfScopeToctreeFilter(reference_env))
+
+    restrict_writing(app.builder, language, reference_env)
+
+#############################################################
+# Setup
+
+def setup(app):
+    app.connect('config-inited', on_config_inited)
+    app.connect('builder-inited', on_builder_inited)
+    app.add_post_transform(ReferenceEnvironmentResolver)
@@ -1,3 +1,4 @@
+from functools import wraps
 import traceback
 
 def print_traceback(f):
@@ -5,9 +6,10 @@ def print_traceback(f):
     A decorator to display exception trace, because Sphinx hides them for
     some reason...
     """
+    @wraps(f)
     def wrapped(*args, **kwargs):
         try:
-            f(*args, **kwargs)
+            return f(*args, **kwargs)
         except Exception as err:
             print(traceback.format_exc())
             raise err
@@ -41,6 +41,7 @@ extensions = [
     "sphinx_literate",
     "translation",
     "themed_figure",
+    "build_profiler", # disabled unless build_profiler_output is set
 ]
 
 # Add any paths that contain templates here, relative to this directory.
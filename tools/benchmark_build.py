@@ -0,0 +1,231 @@
+"""
+End-to-end build benchmark of the book.
+benchmark_build.py [--builders html tangle] [--modes cold warm chapter translation] [--jobs 1 2 4 8]
+
+Each run records its wall time, the peak RSS of the build, the size of the
+pickled environment and the size of the output. Results are appended to a
+history file, to follow how build times evolve as the book grows.
+Runs offline (Linux only, because of the RSS measure).
+"""
+
+import argparse
+import json
+import os
+import platform
+import shlex
+import shutil
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from importlib import metadata
+from os.path import dirname, join, abspath, exists, getsize
+
+ROOT = dirname(dirname(abspath(__file__)))
+
+parser = argparse.ArgumentParser(
+	prog="benchmark_build",
+	description="""
+	Time the html and tangle builds of the book in several modes and append
+	the results to a history file.
+	""",
+)
+
+parser.add_argument(
+	"--builders",
+	nargs="+",
+	default=["html", "tangle"],
+	help="Sphinx builders to benchmark (default: html tangle)",
+)
+
+parser.add_argument(
+	"--modes",
+	nargs="+",
+	choices=["cold", "warm", "chapter", "translation"],
+	default=["cold", "warm", "chapter", "translation"],
+	help="""
+	cold: build from scratch, warm: rebuild without any change, chapter: rebuild
+	after editing one chapter, translation: rebuild after editing one
+	translated page
+	""",
+)
+
+parser.add_argument(
+	"--jobs",
+	nargs="+",
+	type=int,
+	default=[1, 2, 4, 8],
+	help="Values of -j for which a cold build is run (default: 1 2 4 8)",
+)
+
+parser.add_argument(
+	"--chapter",
+	default="getting-started/hello-webgpu.md",
+	help="Page edited in 'chapter' mode",
+)
+
+parser.add_argument(
+	"--translation",
+	default="translation/ru/getting-started/hello-webgpu.md",
+	help="Page edited in 'translation' mode",
+)
+
+parser.add_argument(
+	"--sphinx-build",
+	default=os.environ.get("SPHINXBUILD", "sphinx-build"),
+	help="Command used to run Sphinx (default: $SPHINXBUILD or sphinx-build)",
+)
+
+parser.add_argument(
+	"--build-dir",
+	default=join(ROOT, "_build", "benchmark"),
+	help="Build directory, erased before cold builds",
+)
+
+parser.add_argument(
+	"--history",
+	default=join(ROOT, "_build", "benchmark-history.json"),
+	help="JSON file that the results are appended to",
+)
+
+#--------------------------------------------------------------------
+
+def dir_size(dirname):
+	total = 0
+	for root, dirs, files in os.walk(dirname):
+		for filename in files:
+			try:
+				total += getsize(join(root, filename))
+			except OSError:
+				pass
+	return total
+
+def run_build(args, builder, jobs):
+	"""
+	Run a build and measure it
+	@return wall time (s), peak RSS (bytes), return code
+	"""
+	command = shlex.split(args.sphinx_build) + [
+		"-M", builder, ROOT, args.build_dir,
+		"-j", str(jobs),
+		"-q",
+	]
+	start = time.perf_counter()
+	process = subprocess.Popen(command, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+	# wait4 gives the resource usage of this build only (ru_maxrss is in KiB
+	# on Linux), including the worker processes it has waited for.
+	_, status, rusage = os.wait4(process.pid, 0)
+	wall_time = time.perf_counter() - start
+	process.returncode = os.waitstatus_to_exitcode(status)
+	return wall_time, rusage.ru_maxrss * 1024, process.returncode
+
+def measure(args, builder, mode, jobs):
+	wall_time, peak_rss, returncode = run_build(args, builder, jobs)
+	env_pickle = join(args.build_dir, "doctrees", "environment.pickle")
+	result = {
+		"builder": builder,
+		"mode": mode,
+		"jobs": jobs,
+		"wall_time": round(wall_time, 3),
+		"peak_rss": peak_rss,
+		"env_pickle_size": getsize(env_pickle) if exists(env_pickle) else None,
+		"output_size": dir_size(join(args.build_dir, builder)),
+		"returncode": returncode,
+	}
+	sys.stderr.write(
+		f"{builder:<8} {mode:<12} -j {jobs}  {wall_time:8.2f}s  "
+		f"{peak_rss / 2**20:7.1f} MiB" + ("" if returncode == 0 else f"  (exit code {returncode})") + "\n"
+	)
+	return result
+
+class EditedFile:
+	"""
+	Append an empty line to a source file and restore it on exit. The build
+	that follows the restoration is not measured, it only brings the build
+	directory back to an up to date state.
+	"""
+	def __init__(self, filename):
+		self.filename = join(ROOT, filename)
+
+	def __enter__(self):
+		with open(self.filename, "rb") as f:
+			self.original = f.read()
+		with open(self.filename, "ab") as f:
+			f.write(b"\n")
+		return self
+
+	def __exit__(self, *exc):
+		with open(self.filename, "wb") as f:
+			f.write(self.original)
+
+def benchmark_builder(args, builder):
+	results = []
+	for jobs in args.jobs if "cold" in args.modes else []:
+		shutil.rmtree(args.build_dir, ignore_errors=True)
+		results.append(measure(args, builder, "cold", jobs))
+
+	if not results:
+		# Other modes need an existing build
+		shutil.rmtree(args.build_dir, ignore_errors=True)
+		run_build(args, builder, 1)
+
+	if "warm" in args.modes:
+		results.append(measure(args, builder, "warm", 1))
+
+	for mode, filename in [("chapter", args.chapter), ("translation", args.translation)]:
+		if mode not in args.modes:
+			continue
+		with EditedFile(filename):
+			results.append(measure(args, builder, mode, 1))
+		run_build(args, builder, 1)
+
+	return results
+
+def package_versions():
+	versions = {}
+	for name in ["sphinx", "myst-parser", "docutils", "pygments", "furo"]:
+		try:
+			versions[name] = metadata.version(name)
+		except metadata.PackageNotFoundError:
+			versions[name] = None
+	return versions
+
+def git_commit():
+	try:
+		return subprocess.run(
+			["git", "rev-parse", "--short", "HEAD"],
+			cwd=ROOT, capture_output=True, text=True, check=True,
+		).stdout.strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+def main(args):
+	if not sys.platform.startswith("linux"):
+		sys.stderr.write("Warning: peak RSS is only measured in bytes on Linux\n")
+
+	runs = []
+	for builder in args.builders:
+		runs += benchmark_builder(args, builder)
+
+	entry = {
+		"commit": git_commit(),
+		"date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+		"python": platform.python_version(),
+		"platform": platform.platform(),
+		"cpu_count": os.cpu_count(),
+		"packages": package_versions(),
+		"runs": runs,
+	}
+
+	history = []
+	if exists(args.history):
+		with open(args.history, "r", encoding="utf-8") as f:
+			history = json.load(f)
+	history.append(entry)
+	os.makedirs(dirname(args.history), exist_ok=True)
+	with open(args.history, "w", encoding="utf-8") as f:
+		json.dump(history, f, indent=2)
+	sys.stderr.write(f"Results appended to {args.history}\n")
+
+if __name__ == "__main__":
+	main(parser.parse_args())